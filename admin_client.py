@@ -0,0 +1,453 @@
+import html
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode, urljoin
+
+import requests
+from bs4 import BeautifulSoup
+
+import metrics
+from net_utils import new_session
+from image_pipeline import get_pipeline
+from sync_ledger import added_items
+
+ADMIN_URL = os.getenv("MOTOBUZZ_ADMIN_URL", "https://www.motobuzz.lv/admin/")
+CATEGORY_PATH = "kategorie-1929"
+SUPPLIER_URL = "https://jopa.nl/en/"
+PRICE_SOURCE_LABEL = "cenu určuje zboží"
+AVAILABILITY_IN_STOCK = "1"
+# Price of an existing product. Only the create form's input#cena is known from the real
+# admin; the inline field is assumed by analogy with CPolozka.ean/CPolozka.code, so the
+# price step uses it when the page has it and otherwise posts the form holding input#cena
+PRICE_FIELD = "CPolozka.cena"
+PRICE_INPUT_ID = "cena"
+
+Page = Tuple[str, BeautifulSoup]
+
+# Related products already linked on the "podobné" tab (their internal codes). The
+# markup is taken from the mock admin, not the real page: when the table is missing
+# the links can't be read, so linking is skipped rather than redone on every run
+PODOBNE_TABLE_SELECTOR = "table.podobne"
+PODOBNE_LINKED_SELECTOR = f"{PODOBNE_TABLE_SELECTOR} td.kod"
+
+
+class AdminClientError(RuntimeError):
+    """
+    Raised when the admin markup or an answer is not what the client expects.
+    `created` is set when the product already exists, so the caller must not
+    create it again.
+    """
+
+    def __init__(self, message: str, created: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.created = created
+
+
+class FieldStep(NamedTuple):
+    """
+    One field to save on a freshly created product. `kind` is "inline" (x-editable,
+    select fields give `label`), "description" (plain text for a TinyMCE editor),
+    "price" (see PRICE_FIELD) or "availability". Late steps are saved only after images and variants.
+    """
+    kind: str
+    name: str
+    value: Optional[str] = None
+    label: Optional[str] = None
+    late: bool = False
+
+
+def build_field_plan(prod: Dict[str, Any], brand_name: str) -> List[FieldStep]:
+    return [
+        FieldStep("inline", "CPolozka.ean", prod['ean']),
+        FieldStep("inline", "CZbozi.dodavatelurl", SUPPLIER_URL),
+        FieldStep("inline", "CZbozi.vyrobce_id", label=brand_name),
+        FieldStep("description", "zbozi.popis", prod['short-description']),
+        FieldStep("description", "zbozi.popis2", prod['long-description']),
+        FieldStep("inline", "CZbozi.zdrojceny", label=PRICE_SOURCE_LABEL, late=True),
+        FieldStep("availability", "dostupnost", AVAILABILITY_IN_STOCK, late=True),
+    ]
+
+
+def build_update_plan(prod: Dict[str, Any], changed: List[str], brand_name: str) -> List[FieldStep]:
+    """
+    Field steps for the `changed` sync_ledger.SYNC_FIELDS groups that are saved
+    as fields (images and sizes are added through their tabs). "setup" redoes the
+    whole build_field_plan of a product that was created but not fully filled.
+    The price is saved through PRICE_FIELD, or the form with input#cena when the
+    product page has no such inline field (an assumption about the real admin).
+    """
+    steps = build_field_plan(prod, brand_name) if "setup" in changed else []
+    if "price" in changed:
+        steps.append(FieldStep("price", PRICE_FIELD, prod['price'].replace(',', '.')))
+    if "descriptions" in changed and "setup" not in changed:
+        steps.append(FieldStep("description", "zbozi.popis", prod['short-description']))
+        steps.append(FieldStep("description", "zbozi.popis2", prod['long-description']))
+    return steps
+
+
+class StepTimer:
+    """
+    Wall time of each step of one product upload, to see which steps are still slow.
+    Every step is also recorded in the upload_step_seconds metric.
+    """
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.steps: List[Tuple[str, float]] = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.steps.append((name, seconds))
+        metrics.observe("upload_step_seconds", seconds, backend=self.backend, step=name)
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.steps)
+        return f"{parts}; всего {time.perf_counter() - self.started:.2f}s"
+
+
+def podobne_query(codes: List[str]) -> Optional[str]:
+    """
+    One filter query listing all `codes` at once: products created in one run get
+    consecutive codes, so their common prefix (P510 for P51001…P51012) finds them
+    together. None when there is no prefix narrower than the bare "P".
+    """
+    prefix = os.path.commonprefix(codes)
+    return prefix if len(codes) > 1 and len(prefix) > 1 else None
+
+
+def row_code(row_text: str, codes) -> Optional[str]:
+    tokens = row_text.split()
+    return next((code for code in codes if code in tokens), None)
+
+
+def extract_external_id(url):
+    return url.rstrip('/').split('-')[-1]
+
+
+def text_to_html(text: str) -> str:
+    """
+    Plain generated text → the HTML TinyMCE would store: one <p> per line.
+    """
+    return "".join(f"<p>{html.escape(line)}</p>" for line in text.splitlines() if line.strip())
+
+
+class AdminClient:
+    """
+    Talks to the motobuzz.lv admin over plain HTTP with one logged-in session.
+    Endpoints are not hard-coded: they are read from the same markup the Selenium
+    path clicks (form actions, x-editable data-url/data-pk/data-source, tab links).
+    """
+
+    def __init__(self, admin_url: str = ADMIN_URL, timeout: int = 30):
+        self.admin_url = admin_url
+        self.category_url = urljoin(admin_url, CATEGORY_PATH)
+        self.timeout = timeout
+        self.session = new_session()
+
+    def _get(self, url: str) -> Page:
+        resp = self.session.get(url, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.url, BeautifulSoup(resp.text, "html.parser")
+
+    def _post(self, url: str, data=None, files=None) -> requests.Response:
+        resp = self.session.post(url, data=data, files=files, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp
+
+    @staticmethod
+    def _form_fields(form) -> Dict[str, str]:
+        data = {}
+        for el in form.find_all(["input", "select", "textarea"]):
+            name = el.get("name")
+            if not name:
+                continue
+            if el.name == "input":
+                kind = el.get("type", "text").lower()
+                if kind in ("submit", "button", "file", "image", "reset"):
+                    continue
+                if kind in ("checkbox", "radio") and not el.has_attr("checked"):
+                    continue
+                data[name] = el.get("value", "")
+            elif el.name == "select":
+                opt = el.find("option", selected=True) or el.find("option")
+                data[name] = opt.get("value", opt.get_text(strip=True)) if opt else ""
+            else:
+                data[name] = el.get_text()
+        return data
+
+    def _submit(self, page: Page, form, values: Dict[str, str], files=None) -> requests.Response:
+        data = self._form_fields(form)
+        data.update(values)
+        return self._post(urljoin(page[0], form.get("action") or page[0]), data, files)
+
+    def login(self, username: str, password: str):
+        page = self._get(self.admin_url)
+        if page[1].select_one(".sidebar"):
+            return
+
+        user_input = page[1].find("input", attrs={"name": "_username"})
+        if not user_input or not user_input.find_parent("form"):
+            raise AdminClientError("Форма входа не найдена")
+        resp = self._submit(page, user_input.find_parent("form"), {"_username": username, "_password": password})
+        if not BeautifulSoup(resp.text, "html.parser").select_one(".sidebar"):
+            raise AdminClientError("Не удалось войти в админку")
+
+    def open_product(self, external_id: str) -> Page:
+        return self._get(f"{self.category_url}/zbozi-{external_id}")
+
+    def _option_value(self, page: Page, anchor, label: str) -> str:
+        source = (anchor.get("data-source") or "").strip()
+        if not source:
+            raise AdminClientError(f"У {anchor.get('data-name')} нет data-source")
+        if source[:1] in "[{":
+            options = json.loads(source)
+        else:
+            resp = self.session.get(urljoin(page[0], source), timeout=self.timeout)
+            resp.raise_for_status()
+            options = resp.json()
+        if isinstance(options, dict):
+            options = [{"value": k, "text": v} for k, v in options.items()]
+
+        for opt in options:
+            if str(opt.get("text", "")).strip() == label:
+                return str(opt.get("value"))
+        raise AdminClientError(f"'{label}' нет среди вариантов {anchor.get('data-name')}")
+
+    def inline_edit(self, page: Page, data_name: str, value: Optional[str] = None, label: Optional[str] = None):
+        """
+        Saves one x-editable field the way the widget does: POST name/pk/value to its data-url.
+        For select fields pass the visible `label` instead of the value.
+        """
+        anchor = page[1].select_one(f"a.inlineedit[data-name='{data_name}']")
+        if not anchor or not anchor.get("data-url"):
+            raise AdminClientError(f"Поле {data_name} не найдено")
+        if label is not None:
+            value = self._option_value(page, anchor, label)
+        self._post(urljoin(page[0], anchor["data-url"]),
+                   {"name": data_name, "pk": anchor.get("data-pk", ""), "value": value})
+
+    def set_description(self, page: Page, data_name: str, text: str):
+        """
+        Submits the description's form. The saved text is also written into `page`,
+        so a later submit of the same form (popis and popis2 may share one) keeps it.
+        """
+        header = page[1].select_one(f"h4[data-for^='{data_name}']")
+        target = header.get("data-for") if header else None
+        area = page[1].find("textarea", id=target) or page[1].find("textarea", attrs={"name": target})
+        form = area.find_parent("form") if area else None
+        if not form:
+            raise AdminClientError(f"Редактор {data_name} не найден")
+        html = text_to_html(text)
+        self._submit(page, form, {area["name"]: html})
+        area.string = html
+
+    def _presenter(self, page: Page, presenter: str) -> Page:
+        tab = page[1].select_one(f"a[data-presenter='{presenter}']")
+        href = tab and (tab.get("data-url") or tab.get("href"))
+        if not href or href.startswith(("#", "javascript")):
+            raise AdminClientError(f"Вкладка {presenter} не найдена")
+        return self._get(urljoin(page[0], href))
+
+    def upload_images(self, page: Page, image_urls: List[str]):
+        gallery = self._presenter(page, "img_galerie")
+        file_input = gallery[1].select_one("div.galerie_container input[name='upload[]']")
+        form = file_input.find_parent("form") if file_input else None
+        if not form:
+            raise AdminClientError("Форма галереи не найдена")
+
+        files = []
+        for path in get_pipeline().paths(image_urls):
+            with open(path, "rb") as f:
+                files.append(("upload[]", (os.path.basename(path), f.read())))
+        if files:
+            self._submit(gallery, form, {}, files=files)
+
+    def add_variants(self, page: Page, names: List[str]):
+        variants = self._presenter(page, "zbozi_varianty")
+        name_input = variants[1].find("input", id="nazev")
+        form = name_input.find_parent("form") if name_input else None
+        if not form:
+            raise AdminClientError("Форма вариантов не найдена")
+        for name in names:
+            self._submit(variants, form, {name_input["name"]: name})
+
+    def _select_podobne(self, page: Page, query: str, codes: List[str]) -> List[str]:
+        """
+        Filters the "podobné" product table by `query` and selects, in one submit,
+        every listed product whose code is in `codes`. Returns the codes selected.
+        """
+        filter_form = page[1].select_one("form.filtr")
+        search = filter_form and filter_form.find("input", id="hledat")
+        if not search:
+            raise AdminClientError("Фильтр похожих товаров не найден")
+        action = urljoin(page[0], filter_form.get("action") or page[0])
+        fields = {**self._form_fields(filter_form), search["name"]: query}
+        if (filter_form.get("method") or "get").lower() == "get":
+            results = self._get(f"{action}?{urlencode(fields)}")
+        else:
+            resp = self._post(action, fields)
+            results = (resp.url, BeautifulSoup(resp.text, "html.parser"))
+
+        table = results[1].select_one("table.produkty")
+        form = table.find_parent("form") if table else None
+        if not form:
+            raise AdminClientError("Таблица выбора похожих товаров не найдена")
+        selected, data = [], list(self._form_fields(form).items())
+        for row in table.find_all("tr"):
+            code = row_code(row.get_text(" ", strip=True), codes)
+            checkbox = row.select_one("input[type='checkbox'].zatrhnout")
+            if code and checkbox and code not in selected:
+                selected.append(code)
+                data.append((checkbox["name"], checkbox.get("value", "on")))
+        if selected:
+            self._post(urljoin(results[0], form.get("action") or results[0]), data)
+        return selected
+
+    def add_podobne(self, external_id: str, codes: List[str]) -> Optional[List[str]]:
+        """
+        Links the product to the internal `codes` it isn't linked to yet: one filter
+        query for all of them, then one per code that query didn't list.
+        Returns the codes that were missing, or None when the linked table isn't
+        on the page and nothing was done.
+        """
+        page = self._presenter(self.open_product(external_id), "zbozi_podobne")
+        if not page[1].select_one(PODOBNE_TABLE_SELECTOR):
+            print(f"⚠️ Таблица похожих товаров не найдена у {external_id}, связывание пропущено")
+            return None
+        linked = {td.get_text(strip=True) for td in page[1].select(PODOBNE_LINKED_SELECTOR)}
+        missing = [code for code in codes if code not in linked]
+
+        pending = list(missing)
+        query = podobne_query(pending)
+        if query:
+            selected = self._select_podobne(page, query, pending)
+            pending = [code for code in pending if code not in selected]
+        for code in pending:
+            if not self._select_podobne(page, code, [code]):
+                print(f"⚠️ Товар {code} не найден фильтром")
+        return missing
+
+    def apply_step(self, page: Page, step: FieldStep):
+        if step.kind == "inline":
+            self.inline_edit(page, step.name, step.value, step.label)
+        elif step.kind == "description":
+            self.set_description(page, step.name, step.value)
+        elif step.kind == "price":
+            self.set_price(page, step.value)
+        elif step.kind == "availability":
+            self.set_availability(page, step.value)
+        else:
+            raise AdminClientError(f"Неизвестный шаг {step.kind}")
+
+    def set_price(self, page: Page, value: str):
+        anchor = page[1].select_one(f"a.inlineedit[data-name='{PRICE_FIELD}']")
+        if anchor and anchor.get("data-url"):
+            self.inline_edit(page, PRICE_FIELD, value)
+            return
+        price_input = page[1].find("input", id=PRICE_INPUT_ID)
+        form = price_input.find_parent("form") if price_input else None
+        if not form:
+            raise AdminClientError(f"Поле цены не найдено ни как {PRICE_FIELD}, ни как input#{PRICE_INPUT_ID}")
+        self._submit(page, form, {price_input["name"]: value})
+
+    def set_availability(self, page: Page, value: str = AVAILABILITY_IN_STOCK):
+        select = page[1].find("select", id="dostupnost")
+        button = page[1].select_one("a.nastavit")
+        form = select.find_parent("form") if select else None
+        if form:
+            self._submit(page, form, {select["name"]: value})
+        elif button and button.get("data-url"):
+            self._post(urljoin(page[0], button["data-url"]), {"dostupnost": value})
+        else:
+            raise AdminClientError("Настройка наличия не найдена")
+
+    def update_product(self, entry: Dict[str, Any], prod: Dict[str, Any], changed: List[str], brand_name: str):
+        """
+        HTTP counterpart of uploader.update_product.
+        """
+        timer = StepTimer("http")
+        with timer.step("open"):
+            page = self.open_product(entry["external_id"])
+        plan = build_update_plan(prod, changed, brand_name)
+        for step in plan:
+            if not step.late:
+                with timer.step(step.name):
+                    self.apply_step(page, step)
+
+        new_images = added_items(entry, prod, "images") if "images" in changed else []
+        if new_images:
+            with timer.step("images"):
+                self.upload_images(page, new_images)
+        new_sizes = added_items(entry, prod, "sizes") if "sizes" in changed else []
+        if new_sizes:
+            with timer.step("variants"):
+                self.add_variants(page, new_sizes)
+
+        for step in plan:
+            if step.late:
+                with timer.step(step.name):
+                    self.apply_step(page, step)
+
+        print(f"✔ Обновлено (HTTP): {prod['name']} ({', '.join(changed)}) URL: {entry['product_url']}")
+        print(f"⏱ {timer.summary()}")
+
+    def create_product(self, prod: Dict[str, Any], brand_name: str) -> Dict[str, Any]:
+        """
+        HTTP counterpart of uploader.create_product, returning the same mapping.
+        """
+        page = self._get(self.category_url)
+        name_input = page[1].find("input", id="nazev")
+        price_input = page[1].find("input", id="cena")
+        form = name_input.find_parent("form") if name_input else None
+        if not form or not price_input:
+            raise AdminClientError("Форма добавления товара не найдена")
+
+        resp = self._submit(page, form, {
+            name_input["name"]: prod['name'],
+            price_input["name"]: prod['price'].replace(',', '.'),
+        })
+        if "/zbozi-" not in resp.url:
+            raise AdminClientError("Товар не создан")
+
+        page = (resp.url, BeautifulSoup(resp.text, "html.parser"))
+        code_elem = page[1].select_one('a.inlineedit[data-name="CPolozka.code"]')
+        created = {
+            "product_url": resp.url,
+            "product_pk": "P" + code_elem["data-pk"] if code_elem else None,
+            "external_id": extract_external_id(resp.url),
+            "original_url": prod.get('product_url'),
+        }
+
+        timer = StepTimer("http")
+        try:
+            plan = build_field_plan(prod, brand_name)
+            for step in plan:
+                if not step.late:
+                    with timer.step(step.name):
+                        self.apply_step(page, step)
+            with timer.step("images"):
+                self.upload_images(page, prod['images'])
+            with timer.step("variants"):
+                self.add_variants(page, prod['sizes'])
+            for step in plan:
+                if step.late:
+                    with timer.step(step.name):
+                        self.apply_step(page, step)
+        except (requests.RequestException, AdminClientError, KeyError) as e:
+            raise AdminClientError(f"Ошибка заполнения товара {created['external_id']}: {e}", created=created) from e
+
+        print(f"✔ Готово (HTTP): {prod['name']} (internal PK: {created['product_pk']}, "
+              f"external ID: {created['external_id']}) URL: {created['product_url']}")
+        print(f"⏱ {timer.summary()}")
+        return created
@@ -1,67 +1,281 @@
 import os
-from itertools import cycle
+import re
+import json
+import time
 from dotenv import load_dotenv
-from openai import OpenAI
+
+import metrics
+
+from description_cache import get_cache, description_key
+from llm_scheduler import RateScheduler
 
 load_dotenv()
 keys = [v for k, v in os.environ.items() if k.startswith("OPENROUTER_API_KEY")]
 if not keys:
     raise RuntimeError("Нет ни одного OPENROUTER_API_KEY в окружении")
 
-key_cycle = cycle(keys)
-
-def get_client():
-    key = next(key_cycle)
-    return key, OpenAI(api_key=key, base_url="https://openrouter.ai/api/v1")
-
-def generate_description(name, brand, max_retries=3):
-    system_msg = {
-        "role": "system",
-        "content": (
-            "Tu esi reklāmas tekstu autors latviešu valodā. "
-            "Mēģini atbildēt šādā formā:\n"
-            "1. Īsais: <viena teikuma, līdz 10 vārdiem>\n"
-            "2. Garais: <dažas rindkopas + punkti ar `- `>\n"
-            "Bez HTML, bez Markdown.\n\n"
-            "Obligāti izmanto formātu: '1. Īsais:' un '2. Garais:', katrs no jaunas rindas."
-            "Piemērs:\n"
-            "1. Īsais: Eleganta tekstila moto jaka ar drošību un komfortu.\n"
-            "2. Garais: Furygan 6002-1 Jack Glenn Black ir daudzpusīga motociklistu jaka, kas apvieno izturību, aizsardzību un diskrētu pilsētas stilu. Tā ir lieliski piemērota braucējiem, kuri meklē funkcionālu un stilīgu risinājumu ikdienas lietošanai.\n"
-            "- CE sertificēti plecu un elkoņu aizsargi, ar vietu muguras aizsargam.\n"
-            "- Izturīgs un elpojošs tekstilmateriāls – piemērots dažādiem laikapstākļiem.\n"
-            "- Regulējami aproces, jostasvieta un apkakle – individuālam piegulumam.\n"
-            "- Daudz kabatu un ērta iekšējā odere – praktiskums ikdienas braucienos.\n"
-            "- Klasiski melns dizains – neuzkrītošs un elegants pilsētas stilam."
-        )
-    }
+BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+# Per key/model request budget; free OpenRouter models allow ~20 requests per minute
+LLM_RPM = float(os.getenv("LLM_RPM", "20"))
+LLM_BURST = int(os.getenv("LLM_BURST", "2"))
+# Stream single descriptions and drop an answer as soon as it leaves the expected format
+LLM_STREAM = os.getenv("LLM_STREAM", "1") != "0"
+
+SYSTEM_PROMPT = (
+    "Tu esi reklāmas tekstu autors latviešu valodā. "
+    "Mēģini atbildēt šādā formā:\n"
+    "1. Īsais: <viena teikuma, līdz 10 vārdiem>\n"
+    "2. Garais: <dažas rindkopas + punkti ar `- `>\n"
+    "Bez HTML, bez Markdown.\n\n"
+    "Obligāti izmanto formātu: '1. Īsais:' un '2. Garais:', katrs no jaunas rindas."
+    "Piemērs:\n"
+    "1. Īsais: Eleganta tekstila moto jaka ar drošību un komfortu.\n"
+    "2. Garais: Furygan 6002-1 Jack Glenn Black ir daudzpusīga motociklistu jaka, kas apvieno izturību, aizsardzību un diskrētu pilsētas stilu. Tā ir lieliski piemērota braucējiem, kuri meklē funkcionālu un stilīgu risinājumu ikdienas lietošanai.\n"
+    "- CE sertificēti plecu un elkoņu aizsargi, ar vietu muguras aizsargam.\n"
+    "- Izturīgs un elpojošs tekstilmateriāls – piemērots dažādiem laikapstākļiem.\n"
+    "- Regulējami aproces, jostasvieta un apkakle – individuālam piegulumam.\n"
+    "- Daudz kabatu un ērta iekšējā odere – praktiskums ikdienas braucienos.\n"
+    "- Klasiski melns dizains – neuzkrītošs un elegants pilsētas stilam."
+)
+
+MODELS = [
+    "deepseek/deepseek-prover-v2:free",
+    "mistralai/mistral-7b-instruct:free"
+]
+
+BATCH_PROMPT = (
+    SYSTEM_PROMPT + "\n\n"
+    "Tev tiks doti vairāki produkti JSON masīvā ar laukiem id, name, brand. "
+    "Katram produktam uzraksti aprakstus tādā pašā stilā un atbildi TIKAI ar JSON objektu:\n"
+    '{"items": [{"id": <id>, "short": "<īsais apraksts>", "long": "<garais apraksts ar punktiem `- `>"}]}\n'
+    "Bez paskaidrojumiem ārpus JSON."
+)
+
+# Регулярка, устойчивая к регистру и лишним пробелам
+DESCRIPTION_FORMAT = re.compile(r"1\.\s*Īsais:\s*(.+?)\s*2\.\s*Garais:\s*(.+)", re.S | re.I)
+SHORT_START = re.compile(r"1\.\s*Īsais:", re.I)
+LONG_START = re.compile(r"2\.\s*Garais:", re.I)
+# Characters of a streamed answer allowed before "1. Īsais:", and between it and "2. Garais:"
+# (the short description is one sentence of up to 10 words)
+STREAM_HEAD_LIMIT = 200
+STREAM_SHORT_LIMIT = 400
+
+scheduler = RateScheduler(keys, MODELS, BASE_URL, rpm=LLM_RPM, burst=LLM_BURST)
+
+
+def _key_label(key):
+    # Порядковый номер ключа вместо самого ключа: отчёты метрик уходят за пределы .env
+    return f"key{keys.index(key) + 1}"
+
+
+def description_on_track(text):
+    """
+    False once a partial answer can no longer become '1. Īsais: ... 2. Garais: ...'.
+    """
+    short = SHORT_START.search(text)
+    if not short:
+        return len(text) < STREAM_HEAD_LIMIT
+    return bool(LONG_START.search(text, short.end())) or len(text) - short.end() < STREAM_SHORT_LIMIT
+
+
+def _stream(lease, messages, max_tokens, on_track):
+    """
+    Streams a completion, checking the text with `on_track` as it grows.
+    Returns (text, usage); text is None when the answer was cut off for leaving the format.
+    """
+    stream = lease.client.chat.completions.create(
+        model=lease.model,
+        messages=messages,
+        temperature=0.7,
+        max_tokens=max_tokens,
+        stream=True,
+        # Без этого OpenAI-совместимые API не присылают usage в потоке; он приходит последним куском без choices
+        stream_options={"include_usage": True}
+    )
+    text, usage = "", None
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            text += delta
+            if not on_track(text):
+                return None, usage
+    finally:
+        stream.close()
+    return text, usage
+
+
+def _complete(messages, max_tokens, attempts, accept, on_track=None):
+    """
+    Runs a chat completion on the pairs picked by the scheduler until `accept`
+    returns something truthy for the answer. Returns (accepted, model).
+    With `on_track` the answer is streamed and abandoned as soon as `on_track`
+    rejects the text so far; the next attempt goes to another key/model.
+    """
+    for _ in range(attempts):
+        lease = scheduler.acquire()
+        if lease is None:
+            print("[ERROR] Нет доступных ключей/моделей")
+            break
+        labels = {"model": lease.model, "key": _key_label(lease.key)}
+        t0 = time.perf_counter()
+        try:
+            if on_track:
+                content, usage = _stream(lease, messages, max_tokens, on_track)
+            else:
+                resp = lease.client.chat.completions.create(
+                    model=lease.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=max_tokens
+                )
+                content = resp.choices[0].message.content if resp.choices else None
+                usage = getattr(resp, "usage", None)
+        except Exception as e:
+            metrics.observe("llm_request_seconds", time.perf_counter() - t0, **labels)
+            metrics.inc("llm_requests_total", outcome=type(e).__name__, **labels)
+            scheduler.report(lease, e)
+            print(f"[ERROR] {lease.route} — {type(e).__name__}: {e}")
+            continue
+        metrics.observe("llm_request_seconds", time.perf_counter() - t0, **labels)
+        if usage:
+            metrics.inc("llm_tokens_total", usage.prompt_tokens or 0, kind="prompt", **labels)
+            metrics.inc("llm_tokens_total", usage.completion_tokens or 0, kind="completion", **labels)
+
+        if on_track and content is None:
+            metrics.inc("llm_requests_total", outcome="off_format", **labels)
+            scheduler.report(lease, ValueError("off-format answer"))
+            print(f"[WARN] Ответ {lease.route} ушёл от формата, прерываем и пробуем другой")
+            continue
+        result = accept(content.strip()) if content else None
+        if result:
+            metrics.inc("llm_requests_total", outcome="ok", **labels)
+            scheduler.report(lease)
+            return result, lease.model
+        metrics.inc("llm_requests_total", outcome="unusable", **labels)
+        scheduler.report(lease, ValueError("unusable answer"))
+        print(f"[WARN] Пустой или некорректный ответ от {lease.route}")
+    return None, None
+
+def cached_description(name, brand):
+    """
+    Looks the product up in the description cache for every model, in MODELS order.
+    """
+    cache = get_cache()
+    if not cache:
+        return None
+    for model in MODELS:
+        cached = cache.get(description_key(name, brand, SYSTEM_PROMPT, model))
+        if cached:
+            cache.record(hit=True)
+            metrics.inc("llm_cache_total", result="hit")
+            return cached
+    cache.record(hit=False)
+    metrics.inc("llm_cache_total", result="miss")
+    return None
+
+def generate_description(name, brand, max_retries=3, use_cache=True):
+    """
+    Returns the raw '1. Īsais: ... 2. Garais: ...' text for a product. Only
+    well-formed answers are accepted; with LLM_STREAM an answer going off format
+    is cut short. Answers are stored in the description cache, so the same
+    name/brand/prompt/model is never sent to the API twice.
+    """
+    if use_cache:
+        cached = cached_description(name, brand)
+        if cached:
+            return cached
+    cache = get_cache()
+
+    system_msg = {"role": "system", "content": SYSTEM_PROMPT}
 
     user_msg = {
         "role": "user",
         "content": f"Ģenerē aprakstu produktam «{name}» no zīmola «{brand}»."
     }
 
-    models = [
-        "deepseek/deepseek-prover-v2:free",
-        "mistralai/mistral-7b-instruct:free"
+    content, model = _complete([system_msg, user_msg], 1024, max_retries * len(MODELS) * len(keys),
+                               accept=lambda text: text if DESCRIPTION_FORMAT.search(text) else None,
+                               on_track=description_on_track if LLM_STREAM else None)
+    if content:
+        if cache:
+            cache.put(description_key(name, brand, SYSTEM_PROMPT, model), name, brand, model, content)
+        return content
+    return f"(Apraksta ģenerēšanas kļūda: {name})"
+
+def format_description(short, long):
+    return f"1. Īsais: {short}\n2. Garais: {long}"
+
+def _parse_batch_answer(content, count):
+    """
+    Validates a batch answer and returns {index: raw description} for the usable items.
+    """
+    content = re.sub(r"^```(?:json)?|```$", "", content.strip()).strip()
+    start = min((i for i in (content.find("{"), content.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return {}
+    try:
+        data, _ = json.JSONDecoder().raw_decode(content[start:])
+    except ValueError:
+        return {}
+    items = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return {}
+
+    result = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        idx, short, long = item.get("id"), item.get("short"), item.get("long")
+        if isinstance(idx, str) and idx.isdigit():
+            idx = int(idx)
+        if not isinstance(idx, int) or not 0 <= idx < count or idx in result:
+            continue
+        if not isinstance(short, str) or not isinstance(long, str) or not short.strip() or not long.strip():
+            continue
+        result[idx] = format_description(short.strip(), long.strip())
+    return result
+
+def _request_batch(products, max_retries):
+    payload = [{"id": i, "name": name, "brand": brand} for i, (name, brand) in enumerate(products)]
+    messages = [
+        {"role": "system", "content": BATCH_PROMPT},
+        {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
     ]
+    answers, model = _complete(messages, 600 * len(products), max_retries * len(MODELS) * len(keys),
+                               accept=lambda text: _parse_batch_answer(text, len(products)))
+    return answers or {}, model
 
-    for _ in range(max_retries):
-        for model in models:
-            for _ in range(len(keys)):
-                key, client = get_client()
-                try:
-                    resp = client.chat.completions.create(
-                        model=model,
-                        messages=[system_msg, user_msg],
-                        temperature=0.7,
-                        max_tokens=1024
-                    )
-                    content = resp.choices[0].message.content.strip() if resp.choices else None
-                    if content:
-                        return content
-                    else:
-                        print(f"[WARN] Пустой ответ от модели {model} с ключом {key[:8]}...")
-                except Exception as e:
-                    print(f"[ERROR] {model} — ключ {key[:8]}... — {type(e).__name__}: {e}")
-    return f"(Apraksta ģenerēšanas kļūda: {name})"
+def generate_descriptions_batch(products, batch_size=10, max_retries=2):
+    """
+    Generates raw descriptions for a list of (name, brand) pairs, `batch_size`
+    products per request. Returns them in input order; items missing or invalid
+    in the batch answer fall back to generate_description.
+    """
+    cache = get_cache()
+    results = [cached_description(name, brand) for name, brand in products]
+    pending = [i for i, raw in enumerate(results) if raw is None]
+
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        if len(chunk) == 1:
+            break
+        answers, model = _request_batch([products[i] for i in chunk], max_retries)
+        for j, i in enumerate(chunk):
+            raw = answers.get(j)
+            if raw is None:
+                continue
+            results[i] = raw
+            if cache:
+                name, brand = products[i]
+                cache.put(description_key(name, brand, SYSTEM_PROMPT, model), name, brand, model, raw)
+        missing = len(chunk) - len(answers)
+        if missing:
+            print(f"[WARN] {missing} из {len(chunk)} описаний не получены пакетом, генерируем по одному")
 
+    for i, raw in enumerate(results):
+        if raw is None:
+            results[i] = generate_description(*products[i], use_cache=False)
+    return results
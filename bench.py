@@ -0,0 +1,553 @@
+"""
+Offline benchmark of the importer stages: crawl (collect_all_final_pages_async),
+product extraction (get_product_details), description generation
+(generate_description) and upload (upload_stream over HTTP).
+
+Everything runs against local stand-ins started in this process: a server with
+supplier pages (a synthetic brand, or pages recorded from jopa.nl with `record`),
+an OpenAI-compatible endpoint with configurable latency and 429 rate, and the
+mock admin (mock_admin.py). Caches, the sync ledger and the image cache live in a
+temporary directory, so every run starts cold and nothing real is touched.
+Reports items/sec and p50/p95 latency per stage and saves them as JSON; with
+--baseline the run exits with 1 when a stage got slower than the tolerance.
+
+    python bench.py run --products 200 --llm-latency 0.8 --llm-429 0.1
+    python bench.py record sidi --limit 100 --dir bench_fixtures/sidi   # needs network
+    python bench.py run --fixtures bench_fixtures/sidi --baseline output/bench/bench-20261018-120000.json
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext, redirect_stdout
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import metrics
+from mock_admin import MockAdmin, serve as serve_admin
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+BENCH_DIR = os.path.join("output", "bench")
+DESCRIPTION_ERROR = "(Apraksta ģenerēšanas kļūda"
+
+
+def _key(path: str) -> str:
+    return path.split("?", 1)[0].rstrip("/") or "/"
+
+
+def _listing(links) -> str:
+    return "<html><body>" + "".join(f'<a href="{href}">{href}</a>' for href in links) + "</body></html>"
+
+
+class FixtureSite:
+    """
+    Supplier pages by URL path ("/en/sidi/boots"). Image sources are site-relative
+    ("/img/..."); the site server answers every /img/ path with its own JPEG.
+    """
+
+    def __init__(self, brand: str, pages: dict):
+        self.brand = brand
+        self.pages = pages
+
+    @classmethod
+    def synthetic(cls, products: int = 60, categories: int = 3, subcategories: int = 4, brand: str = "bench"):
+        """
+        A brand shaped like jopa.nl: brand page → categories → subcategories → one
+        final page per product (size tiles) → product page with 3 images.
+        """
+        root = f"/en/{brand}"
+        cats = [f"{root}/cat-{c}" for c in range(categories)]
+        subs = {f"{cat}/sub-{s}": [] for cat in cats for s in range(subcategories)}
+        pages = {root: _listing(cats)}
+        for cat in cats:
+            pages[cat] = _listing([sub for sub in subs if sub.startswith(cat + "/")])
+
+        for i in range(products):
+            sub = list(subs)[i % len(subs)]
+            final = f"{sub}/item-{i}"
+            subs[sub].append(final)
+            sku = f"BN{i:04d}"
+            product = f"/en/{sku.lower()}"
+            tiles = "".join(
+                f'<div class="shopTegel"><a class="link" href="{product}">{size}</a>'
+                f'<span class="nummer">{sku}-{size}</span></div>'
+                for size in ("S", "M", "L")
+            )
+            pages[final] = f'<html><body><div class="artikel"></div><a href="{root}/">home</a>{tiles}</body></html>'
+            images = "".join(f'<div class="carousel-cell-groot"><img src="/img/{sku}-{n}.jpg"></div>' for n in range(3))
+            pages[product] = (
+                f'<html><body><div class="omschrijving"><h1>Bench Model {sku} Black 42</h1></div>{images}'
+                f'<span class="displayprijs">{99 + i % 50},95<small>EUR</small></span>'
+                f'<div class="EANnummer"><span>EAN</span><span>8712{i:09d}</span></div></body></html>'
+            )
+        for sub, finals in subs.items():
+            pages[sub] = _listing(finals)
+        return cls(brand, pages)
+
+    @classmethod
+    def load(cls, directory: str):
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        pages = {}
+        for path, name in manifest["pages"].items():
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                pages[path] = f.read()
+        return cls(manifest["brand"], pages)
+
+    def save(self, directory: str):
+        os.makedirs(os.path.join(directory, "pages"), exist_ok=True)
+        manifest = {"brand": self.brand, "pages": {}}
+        for n, (path, html) in enumerate(sorted(self.pages.items()), 1):
+            name = f"pages/{n:06d}.html"
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                f.write(html)
+            manifest["pages"][path] = name
+        with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+@lru_cache(maxsize=None)
+def placeholder_jpeg(path: str) -> bytes:
+    # Разные байты для каждого пути, иначе кэш изображений схлопнет их в один файл
+    seed = hashlib.sha256(path.encode("utf-8")).digest()
+    if Image is None:
+        return b"\xff\xd8\xff\xfe" + seed
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), tuple(seed[:3])).save(out, "JPEG")
+    return out.getvalue()
+
+
+def _send(handler, status: int, body: bytes, ctype: str, headers=None):
+    handler.send_response(status)
+    handler.send_header("Content-Type", ctype)
+    handler.send_header("Content-Length", str(len(body)))
+    for k, v in (headers or {}).items():
+        handler.send_header(k, v)
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def _start(handler_class, port: int = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def serve_site(site: FixtureSite, latency: float = 0.0, port: int = 0) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            path = self.path.split("?", 1)[0]
+            if path.startswith("/img/"):
+                return _send(self, 200, placeholder_jpeg(path), "image/jpeg")
+            html = site.pages.get(_key(path))
+            if html is None:
+                return _send(self, 404, b"not found", "text/plain")
+            html = html.replace('src="/img/', f'src="http://{self.headers["Host"]}/img/')
+            _send(self, 200, html.encode("utf-8"), "text/html; charset=utf-8")
+
+    return _start(Handler, port)
+
+
+class FakeLLM:
+    """
+    Answers chat completions in the format ai_description expects (single
+    '1. Īsais/2. Garais' text, or the batch JSON) after `latency` seconds (±50%),
+    streamed as server-sent events when the request asks for it. With probability
+    `rate_429` it answers 429 + Retry-After, with probability `malformed` a text
+    without the expected structure.
+    """
+
+    STREAM_CHUNK = 24
+
+    def __init__(self, latency: float = 0.3, rate_429: float = 0.0, malformed: float = 0.0,
+                 retry_after: float = 1.0, seed: int = 0):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.malformed = malformed
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        with self._lock:
+            return self._random.random(), self._random.random(), self._random.uniform(0.5, 1.5)
+
+    def reply(self, body: dict):
+        """
+        Returns (content, delay) for one request body, or (None, None) for a 429.
+        """
+        limited, broken, jitter = self._roll()
+        if limited < self.rate_429:
+            return None, None
+        user = body["messages"][-1]["content"]
+        if broken < self.malformed:
+            content = "Šis produkts ir lielisks izvēles variants ikvienam braucējam. " * 20
+        elif user.startswith("["):
+            items = [{"id": item["id"], "short": f"Īss apraksts: {item['name']}.",
+                      "long": f"Garš apraksts par {item['name']}.\n- Punkts"} for item in json.loads(user)]
+            content = json.dumps({"items": items}, ensure_ascii=False)
+        else:
+            content = f"1. Īsais: Īss apraksts.\n2. Garais: {user}\n- Punkts"
+        return content, self.latency * jitter
+
+    def usage(self, body: dict, content: str) -> dict:
+        prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_tokens + len(content) // 4}
+
+
+def serve_llm(llm: FakeLLM, port: int = 0) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                return _send(self, 404, b"{}", "application/json")
+            content, delay = llm.reply(body)
+            if content is None:
+                error = {"error": {"message": "Rate limit exceeded", "code": 429}}
+                return _send(self, 429, json.dumps(error).encode("utf-8"), "application/json",
+                             {"Retry-After": f"{llm.retry_after:g}"})
+            base = {"id": "bench", "created": int(time.time()), "model": body["model"]}
+            if not body.get("stream"):
+                time.sleep(delay)
+                payload = {**base, "object": "chat.completion", "usage": llm.usage(body, content), "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}
+                return _send(self, 200, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json")
+
+            # Задержка делится между первым токеном и остальными кусками ответа
+            pieces = [content[i:i + llm.STREAM_CHUNK] for i in range(0, len(content), llm.STREAM_CHUNK)]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            time.sleep(delay / 2)
+            try:
+                for n, piece in enumerate(pieces):
+                    last = n == len(pieces) - 1
+                    chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                        {"index": 0, "delta": {"content": piece}, "finish_reason": "stop" if last else None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(delay / 2 / len(pieces))
+                # Как у настоящих API: usage только по запросу, отдельным куском с пустым choices
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    chunk = {**base, "object": "chat.completion.chunk", "choices": [],
+                             "usage": llm.usage(body, content)}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент прервал поток: ответ ушёл от формата
+                pass
+
+    return _start(Handler, port)
+
+
+def _timed_map(func, items, workers: int):
+    """
+    Runs `func` on every item with `workers` threads; returns (results, histogram of call seconds).
+    """
+    hist, lock = metrics.Histogram(), threading.Lock()
+
+    def run(item):
+        t0 = time.perf_counter()
+        result = func(item)
+        with lock:
+            hist.observe(time.perf_counter() - t0)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(run, items)), hist.summary()
+
+
+def _stage(items: int, seconds: float, latency: dict, **extra) -> dict:
+    return {
+        "items": items,
+        "seconds": round(seconds, 3),
+        "per_sec": round(items / seconds, 2) if seconds else 0.0,
+        "p50": latency.get("p50", 0.0),
+        "p95": latency.get("p95", 0.0),
+        **extra,
+    }
+
+
+def _histogram(report: dict, name: str, **labels) -> dict:
+    for h in report["histograms"]:
+        if h["name"] == name and all(h["labels"].get(k) == v for k, v in labels.items()):
+            return h
+    return {}
+
+
+def _counter(report: dict, name: str, **labels) -> float:
+    return sum(c["value"] for c in report["counters"]
+               if c["name"] == name and all(c["labels"].get(k) == v for k, v in labels.items()))
+
+
+def run_bench(site: FixtureSite, args) -> dict:
+    """
+    Starts the stand-ins, points the importer at them through the environment and
+    times each stage in turn. Returns the report.
+    """
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    slug = site.brand
+    brand_name = slug.replace("-", " ").upper()
+    site_server = serve_site(site, latency=args.site_latency)
+    llm_server = serve_llm(FakeLLM(args.llm_latency, args.llm_429, args.llm_malformed, seed=args.seed))
+    admin = MockAdmin(brands=[brand_name], latency=args.admin_latency)
+    admin_server = serve_admin(admin, port=0)
+
+    # Модули импортера читают настройки при импорте, поэтому окружение задаём до него
+    os.environ.update({
+        "JOPA_BASE_URL": _url(site_server),
+        "OPENROUTER_BASE_URL": _url(llm_server) + "/v1",
+        "MOTOBUZZ_ADMIN_URL": _url(admin_server) + "/admin/",
+        "LLM_RPM": str(args.llm_rpm),
+        "HTTP_CACHE": "0",
+        "DESCRIPTION_CACHE": "0",
+        "SYNC_LEDGER_PATH": os.path.join(workdir, "sync_ledger.sqlite3"),
+        "IMAGE_CACHE_DIR": os.path.join(workdir, "images"),
+    })
+    for n in range(args.llm_keys):
+        os.environ[f"OPENROUTER_API_KEY_BENCH{n + 1}"] = f"bench-key-{n + 1}"
+
+    import parser
+    from ai_description import generate_description
+    from main import (CRAWL_WORKERS, CRAWL_PER_HOST, EXTRACT_WORKERS, EXTRACT_FETCH_LIMIT, EXTRACT_LLM_LIMIT,
+                      PARSE_PROCESSES)
+    from uploader import UPLOAD_WORKERS, upload_stream
+
+    quiet = nullcontext if args.verbose else lambda: redirect_stdout(io.StringIO())
+    stages = {}
+    try:
+        print(f"⏱ Обход: {_url(site_server)}/en/{slug}")
+        metrics.REGISTRY.reset()
+        t0 = time.perf_counter()
+        with quiet():
+            pages = asyncio.run(parser.collect_all_final_pages_async(
+                f"{parser.BASE_URL}/en/{slug}", slug,
+                workers=CRAWL_WORKERS, per_host=CRAWL_PER_HOST, delay=args.crawl_delay,
+            ))
+        report = metrics.REGISTRY.report()
+        stages["crawl"] = _stage(int(_counter(report, "http_requests_total")), time.perf_counter() - t0,
+                                 _histogram(report, "http_request_seconds"), final_pages=len(pages))
+
+        print(f"⏱ Извлечение: {len(pages)} страниц")
+        parser.set_extraction_limits(fetch=EXTRACT_FETCH_LIMIT, llm=EXTRACT_LLM_LIMIT)
+        parser.set_parse_pool(PARSE_PROCESSES)
+        t0 = time.perf_counter()
+        try:
+            with quiet():
+                products, latency = _timed_map(lambda url: parser.get_product_details(slug, url, describe=False),
+                                               pages, EXTRACT_WORKERS)
+        finally:
+            parser.set_parse_pool(0)
+        products = [p for p in products if p]
+        stages["extract"] = _stage(len(products), time.perf_counter() - t0, latency)
+
+        names = list(dict.fromkeys(p["name"] for p in products))
+        print(f"⏱ Описания: {len(names)} товаров")
+        metrics.REGISTRY.reset()
+        t0 = time.perf_counter()
+        with quiet():
+            raws, latency = _timed_map(lambda name: generate_description(name, brand_name, use_cache=False),
+                                       names, EXTRACT_LLM_LIMIT)
+        report = metrics.REGISTRY.report()
+        stages["describe"] = _stage(len(names), time.perf_counter() - t0, latency,
+                                    failed=sum(raw.startswith(DESCRIPTION_ERROR) for raw in raws),
+                                    rate_limited=int(_counter(report, "llm_requests_total", outcome="RateLimitError")),
+                                    off_format=int(_counter(report, "llm_requests_total", outcome="off_format")))
+        by_name = dict(zip(names, raws))
+        for prod in products:
+            prod.update(parser.split_description(by_name[prod["name"]]))
+
+        print(f"⏱ Загрузка: {len(products)} записей")
+        metrics.REGISTRY.reset()
+        t0 = time.perf_counter()
+        with quiet():
+            counts = upload_stream(products, brand_name, admin.username, admin.password,
+                                   backend="http", workers=UPLOAD_WORKERS)
+        report = metrics.REGISTRY.report()
+        stages["upload"] = _stage(len(admin.state()), time.perf_counter() - t0,
+                                  _histogram(report, "upload_product_seconds", action="create"), **counts)
+    finally:
+        for server in (site_server, llm_server, admin_server):
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "run_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "fixtures": args.fixtures or f"synthetic:{args.products}",
+        "config": {
+            "site_latency": args.site_latency, "llm_latency": args.llm_latency, "llm_429": args.llm_429,
+            "llm_malformed": args.llm_malformed,
+            "llm_keys": args.llm_keys, "llm_rpm": args.llm_rpm, "admin_latency": args.admin_latency,
+            "crawl_delay": args.crawl_delay, "crawl_workers": CRAWL_WORKERS, "extract_workers": EXTRACT_WORKERS,
+            "llm_limit": EXTRACT_LLM_LIMIT, "upload_workers": UPLOAD_WORKERS,
+        },
+        "stages": stages,
+    }
+
+
+def print_report(report: dict):
+    print(f"\n{'этап':<10}{'штук':>8}{'сек.':>9}{'в сек.':>9}{'p50, мс':>10}{'p95, мс':>10}")
+    for name, s in report["stages"].items():
+        print(f"{name:<10}{s['items']:>8}{s['seconds']:>9.2f}{s['per_sec']:>9.2f}"
+              f"{s['p50'] * 1000:>10.0f}{s['p95'] * 1000:>10.0f}")
+    describe = report["stages"].get("describe")
+    if describe:
+        print(f"Описания: {describe['failed']} ошибок, {describe['rate_limited']} ответов 429, "
+              f"{describe['off_format']} прервано не по формату")
+
+
+def compare(report: dict, baseline: dict, tolerance: float):
+    """
+    Stages whose throughput dropped or p95 latency grew by more than `tolerance` against `baseline`.
+    """
+    regressions = []
+    for name, cur in report["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old:
+            continue
+        if old["per_sec"] and cur["per_sec"] < old["per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {old['per_sec']} → {cur['per_sec']} в сек.")
+        if old["p95"] and cur["p95"] > old["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old['p95'] * 1000:.0f} → {cur['p95'] * 1000:.0f} мс")
+    return regressions
+
+
+def record(brand: str, limit: int, directory: str):
+    """
+    Crawls the brand on jopa.nl like the importer does and saves every listing,
+    final and product page it opened, until `limit` products are recorded. Links
+    point at the site root and image sources at /img/, so the pages work from the
+    benchmark's site server; links beyond the limit answer 404 there.
+    """
+    from bs4 import BeautifulSoup
+    from net_utils import safe_request
+    from parser import BASE_URL, HTML_PARSER, parse_category_html
+
+    slug = brand.strip().lower().replace(" ", "-")
+    pattern = f"/en/{slug}/"
+
+    def localize(html):
+        soup = BeautifulSoup(html.replace(BASE_URL, ""), HTML_PARSER)
+        for img in soup.select("div.carousel-cell-groot img"):
+            if img.get("src"):
+                img["src"] = f"/img/{hashlib.sha1(img['src'].encode('utf-8')).hexdigest()[:16]}.jpg"
+        return str(soup)
+
+    def path_of(href):
+        return _key(urlparse(href).path if href.startswith("http") else href)
+
+    root = f"/en/{slug}"
+    queue, seen, pages, recorded = deque([root]), {root}, {}, 0
+    while queue and recorded < limit:
+        path = queue.popleft()
+        resp = safe_request(BASE_URL + path)
+        if not resp:
+            continue
+        pages[path] = localize(resp.text)
+        soup = BeautifulSoup(resp.text, HTML_PARSER)
+        for a in soup.select(f"a[href*='{pattern}']"):
+            link = path_of(a.get("href", ""))
+            if link not in seen:
+                seen.add(link)
+                queue.append(link)
+        if soup.select_one("div.artikel"):
+            href, _ = parse_category_html(resp.text)
+            product = path_of(href) if href else None
+            if product and product not in pages:
+                product_resp = safe_request(BASE_URL + product)
+                if product_resp:
+                    pages[product] = localize(product_resp.text)
+                    recorded += 1
+                    print(f"  {recorded}/{limit}: {product}")
+
+    FixtureSite(slug, pages).save(directory)
+    print(f"✅ {len(pages)} страниц ({recorded} товаров) сохранено в {directory}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Офлайн-бенчмарк обхода, извлечения, описаний и загрузки")
+    sub = arg_parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="прогнать все этапы на локальных заглушках")
+    run.add_argument("--fixtures", help="каталог, записанный командой record (по умолчанию синтетический бренд)")
+    run.add_argument("--products", type=int, default=60, help="товаров в синтетическом бренде")
+    run.add_argument("--site-latency", type=float, default=0.02, help="задержка страниц поставщика, сек.")
+    run.add_argument("--llm-latency", type=float, default=0.3, help="средняя задержка ответа LLM, сек.")
+    run.add_argument("--llm-429", type=float, default=0.05, help="доля ответов 429")
+    run.add_argument("--llm-malformed", type=float, default=0.0, help="доля ответов не в формате")
+    run.add_argument("--llm-keys", type=int, default=2, help="сколько ключей отдать планировщику")
+    run.add_argument("--llm-rpm", type=float, default=600, help="лимит запросов в минуту на ключ/модель")
+    run.add_argument("--admin-latency", type=float, default=0.02, help="задержка админки, сек.")
+    run.add_argument("--crawl-delay", type=float, default=0.0, help="пауза между запросами к хосту при обходе")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--out", default=BENCH_DIR, help="куда сохранить JSON-отчёт")
+    run.add_argument("--baseline", help="отчёт прошлого прогона для сравнения")
+    run.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение, доля")
+    run.add_argument("--verbose", action="store_true", help="не скрывать вывод этапов")
+
+    rec = sub.add_parser("record", help="записать страницы бренда с jopa.nl как фикстуры")
+    rec.add_argument("brand")
+    rec.add_argument("--limit", type=int, default=100, help="сколько товаров записать")
+    rec.add_argument("--dir", help="каталог фикстур (по умолчанию bench_fixtures/<бренд>)")
+    args = arg_parser.parse_args()
+
+    if args.command == "record":
+        record(args.brand, args.limit, args.dir or os.path.join("bench_fixtures", args.brand.lower()))
+        return
+
+    site = FixtureSite.load(args.fixtures) if args.fixtures else FixtureSite.synthetic(args.products)
+    report = run_bench(site, args)
+    print_report(report)
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📊 Отчёт: {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"❌ Регрессия: {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ Без регрессий относительно базового прогона")
+
+
+if __name__ == "__main__":
+    main()
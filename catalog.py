@@ -0,0 +1,292 @@
+"""
+Indexed SQLite store of extracted products, one row per category page (the
+same record product_details/<brand>_products.jsonl holds), with brand, EAN,
+product_url and subcategory as indexed columns. Extraction writes to it as
+products arrive; JSON export keeps the old file format available.
+
+    python catalog.py import product_details/*.json*
+    python catalog.py stats
+    python catalog.py dupes                       # EANs listed under more than one product
+    python catalog.py export --brand sidi --out product_details/sidi_products.json
+    python catalog.py upload --brand sidi --subcategory boots --skip-ean-dupes
+    python catalog.py refresh --brand sidi        # prices and sizes only, e.g. hourly from cron
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from product_store import iter_products, merge_duplicate_products
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", os.path.join("product_details", "catalog.sqlite3"))
+NO_EAN = ("", "Not found")
+
+
+def brand_slug(brand: str) -> str:
+    return brand.strip().lower().replace(" ", "-")
+
+
+def subcategory_of(category_url: str, brand: Optional[str] = None) -> str:
+    """
+    Path between the brand and the final page ("men-leather" for
+    .../en/furygan/men-leather/l-audacieux); "" for pages right under the brand.
+    Without a brand (or when the URL doesn't contain it) the page's parent segment.
+    """
+    if brand:
+        marker = f"/{brand_slug(brand)}/"
+        lowered = category_url.lower()
+        if marker in lowered:
+            parts = category_url[lowered.index(marker) + len(marker):].strip("/").split("/")
+            return "/".join(parts[:-1])
+    parts = category_url.split("/")
+    return parts[-2] if len(parts) > 1 else ""
+
+
+class CatalogStore:
+    def __init__(self, path: str = CATALOG_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS products (
+                category_url TEXT PRIMARY KEY,
+                brand        TEXT NOT NULL,
+                product_url  TEXT NOT NULL,
+                subcategory  TEXT NOT NULL,
+                ean          TEXT,
+                data         TEXT NOT NULL,
+                updated_at   REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS products_brand ON products(brand, subcategory)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS products_ean ON products(ean)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS products_product_url ON products(product_url)")
+        self._db.commit()
+
+    def put_many(self, products: Iterable[Dict[str, Any]], brand: str) -> int:
+        """
+        Inserts or replaces records (keyed by category_url) in one transaction.
+        A replaced record keeps its place in the brand's order.
+        """
+        brand = brand_slug(brand)
+        now = time.time()
+        rows = [
+            (
+                prod["category_url"], brand, prod["product_url"], subcategory_of(prod["category_url"], brand),
+                None if prod.get("ean") in NO_EAN else prod["ean"], json.dumps(prod, ensure_ascii=False), now,
+            )
+            for prod in products if prod
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(category_url) DO UPDATE SET "
+                "brand = excluded.brand, product_url = excluded.product_url, subcategory = excluded.subcategory, "
+                "ean = excluded.ean, data = excluded.data, updated_at = excluded.updated_at",
+                rows,
+            )
+            self._db.commit()
+        return len(rows)
+
+    def put(self, prod: Dict[str, Any], brand: str):
+        self.put_many([prod], brand)
+
+    def forget(self, brand: str) -> int:
+        """
+        Drops the brand's records, e.g. before a fresh extraction replaces them, so
+        products no longer on the supplier's site are not uploaded from stale rows.
+        """
+        with self._lock:
+            removed = self._db.execute("DELETE FROM products WHERE brand = ?", (brand_slug(brand),)).rowcount
+            self._db.commit()
+        return removed
+
+    def products(self, brand: Optional[str] = None, subcategory: Optional[str] = None,
+                 eans: Optional[List[str]] = None, product_urls: Optional[List[str]] = None,
+                 merged: bool = False) -> List[Dict[str, Any]]:
+        """
+        Records matching every given filter, in extraction order. merged=True
+        collapses records of the same product_url like merge_duplicate_products.
+        """
+        where, params = [], []
+        if brand:
+            where.append("brand = ?")
+            params.append(brand_slug(brand))
+        if subcategory is not None:
+            where.append("subcategory = ?")
+            params.append(subcategory)
+        for column, values in (("ean", eans), ("product_url", product_urls)):
+            if values:
+                where.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        sql = "SELECT data FROM products" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY rowid"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        products = [json.loads(row[0]) for row in rows]
+        return merge_duplicate_products(products) if merged else products
+
+    def grouped(self, brand: str) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        The brand's records by subcategory, read from the index instead of re-splitting URLs.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT subcategory, data FROM products WHERE brand = ? ORDER BY subcategory, rowid",
+                (brand_slug(brand),),
+            ).fetchall()
+        grouped = defaultdict(list)
+        for subcategory, data in rows:
+            grouped[subcategory].append(json.loads(data))
+        return grouped
+
+    def category_urls(self, brand: str) -> set:
+        with self._lock:
+            rows = self._db.execute("SELECT category_url FROM products WHERE brand = ?", (brand_slug(brand),))
+            return {row[0] for row in rows}
+
+    def duplicate_eans(self, brand: Optional[str] = None) -> Dict[str, List[Dict[str, str]]]:
+        """
+        EANs found under more than one product_url (usually the same item listed
+        by two brands), each with its products in extraction order. With `brand`,
+        only EANs that brand's products share with another product.
+        """
+        sql = (
+            "SELECT ean, brand, product_url, MIN(rowid) FROM products WHERE ean IN ("
+            " SELECT ean FROM products WHERE ean IS NOT NULL GROUP BY ean HAVING COUNT(DISTINCT product_url) > 1"
+            ") GROUP BY ean, product_url ORDER BY ean, MIN(rowid)"
+        )
+        with self._lock:
+            rows = self._db.execute(sql).fetchall()
+        dupes = defaultdict(list)
+        for ean, row_brand, product_url, _ in rows:
+            dupes[ean].append({"brand": row_brand, "product_url": product_url})
+        if brand:
+            slug = brand_slug(brand)
+            dupes = {ean: items for ean, items in dupes.items() if any(i["brand"] == slug for i in items)}
+        return dict(dupes)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT brand, COUNT(*), COUNT(DISTINCT product_url), COUNT(DISTINCT subcategory) "
+                "FROM products GROUP BY brand ORDER BY brand"
+            ).fetchall()
+        return {b: {"records": n, "products": p, "subcategories": s} for b, n, p, s in rows}
+
+    def import_file(self, path: str, brand: Optional[str] = None) -> int:
+        """
+        Loads a <brand>_products.json/.jsonl file (brand taken from the file name
+        when not given). Records already in the catalog are replaced, so stray
+        copies of the same file add nothing.
+        """
+        if brand is None:
+            m = re.match(r"(.+?)_products", os.path.basename(path))
+            if not m:
+                raise ValueError(f"Не удалось определить бренд по имени файла: {path}")
+            brand = m.group(1)
+        return self.put_many(iter_products(path), brand)
+
+    def export_json(self, path: str, brand: Optional[str] = None) -> int:
+        """
+        Writes records in the old file format: a JSON array, or JSONL when `path` ends in .jsonl.
+        """
+        products = self.products(brand)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                for prod in products:
+                    f.write(json.dumps(prod, ensure_ascii=False) + "\n")
+            else:
+                json.dump(products, f, ensure_ascii=False, indent=2)
+        return len(products)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> CatalogStore:
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = CatalogStore()
+        return _catalog
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Каталог извлечённых товаров")
+    sub = arg_parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="загрузить старые файлы *_products.json(l)")
+    imp.add_argument("files", nargs="+")
+    imp.add_argument("--brand", help="бренд (по умолчанию из имени файла)")
+    sub.add_parser("stats", help="записей, товаров и подкатегорий по брендам")
+    dupes = sub.add_parser("dupes", help="EAN, встречающиеся у нескольких товаров")
+    dupes.add_argument("--brand")
+    export = sub.add_parser("export", help="выгрузить в JSON (или JSONL)")
+    export.add_argument("--brand")
+    export.add_argument("--out", required=True)
+    upload = sub.add_parser("upload", help="загрузить на сайт выбранные товары")
+    upload.add_argument("--brand", required=True)
+    upload.add_argument("--subcategory")
+    upload.add_argument("--ean", nargs="+", help="только товары с этими EAN")
+    upload.add_argument("--url", nargs="+", help="только товары с этими product_url")
+    upload.add_argument("--skip-ean-dupes", action="store_true",
+                        help="пропустить товары, чей EAN раньше встретился у другого товара")
+    refresh = sub.add_parser("refresh", help="перечитать цены и размеры и обновить их на сайте")
+    refresh.add_argument("--brand", required=True)
+    refresh.add_argument("--no-upload", action="store_true", help="только обновить каталог")
+    refresh.add_argument("--workers", type=int, default=8, help="потоков загрузки страниц")
+    args = arg_parser.parse_args()
+
+    # Через модуль catalog, а не __main__: тот же экземпляр, что и у uploader/refresh
+    from catalog import get_catalog as shared_catalog
+    catalog = shared_catalog()
+    if args.command == "import":
+        for path in args.files:
+            try:
+                print(f"📥 {path}: {catalog.import_file(path, args.brand)} записей")
+            except ValueError as e:
+                print(f"⚠️ {path}: {e}")
+    elif args.command == "stats":
+        for brand, s in catalog.stats().items():
+            print(f"📦 {brand}: {s['products']} товаров ({s['records']} записей), {s['subcategories']} подкатегорий")
+    elif args.command == "dupes":
+        for ean, items in catalog.duplicate_eans(args.brand).items():
+            print(f"🔁 {ean}: " + ", ".join(f"{i['brand']} {i['product_url']}" for i in items))
+    elif args.command == "export":
+        print(f"✅ {catalog.export_json(args.out, args.brand)} записей сохранено в {args.out}")
+    elif args.command == "upload":
+        from uploader import UPLOAD_BACKEND, UPLOAD_WORKERS, admin_credentials, upload_stream
+
+        products = catalog.products(args.brand, subcategory=args.subcategory, eans=args.ean,
+                                    product_urls=args.url, merged=True)
+        if args.skip_ean_dupes:
+            first = {ean: items[0]["product_url"] for ean, items in catalog.duplicate_eans(args.brand).items()}
+            products = [p for p in products if first.get(p.get("ean"), p["product_url"]) == p["product_url"]]
+        print(f"🚀 Загружаем {len(products)} товаров")
+        upload_stream(products, args.brand.replace("-", " ").upper(), *admin_credentials(),
+                      backend=UPLOAD_BACKEND, workers=UPLOAD_WORKERS)
+    elif args.command == "refresh":
+        from metrics import write_metrics
+        from refresh import refresh_brand
+
+        try:
+            counts = refresh_brand(brand_slug(args.brand), upload=not args.no_upload, workers=args.workers)
+        finally:
+            write_metrics("refresh")
+        if counts is None:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import json
+import os
+from typing import List, Optional, Dict, Any
+
+
+class CrawlCheckpoint:
+    """
+    Crawl state (visited URLs, pending frontier, final pages found so far)
+    persisted to a JSON file, so an interrupted crawl can be resumed.
+    The file is rewritten atomically at most once per `every` processed pages.
+    """
+
+    def __init__(self, path: str, start_url: str, every: int = 25):
+        self.path = path
+        self.start_url = start_url
+        self.every = every
+        self._pending = 0
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не удалось прочитать чекпоинт {self.path}: {e}")
+            return None
+        if state.get("start_url") != self.start_url:
+            print(f"⚠️ Чекпоинт {self.path} относится к другому обходу, игнорируем")
+            return None
+        return state
+
+    def due(self, force: bool = False) -> bool:
+        """
+        Counts one processed page; True when the state should be written now.
+        Callers check this before building the (large) state lists.
+        """
+        self._pending += 1
+        if not force and self._pending < self.every:
+            return False
+        self._pending = 0
+        return True
+
+    def save(self, visited: List[str], frontier: List[str], final_pages: List[str], force: bool = False):
+        if self.due(force):
+            self.write(visited, frontier, final_pages)
+
+    def write(self, visited: List[str], frontier: List[str], final_pages: List[str]):
+        state = {
+            "start_url": self.start_url,
+            "visited": visited,
+            "frontier": frontier,
+            "final_pages": final_pages,
+        }
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
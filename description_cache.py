@@ -0,0 +1,163 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+CACHE_PATH = os.getenv("DESCRIPTION_CACHE_PATH", os.path.join(".cache", "descriptions.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("DESCRIPTION_CACHE_MAX_MB", "64")) * 1024 * 1024
+CACHE_ENABLED = os.getenv("DESCRIPTION_CACHE", "1") != "0"
+
+
+def description_key(name: str, brand: str, system_prompt: str, model: str) -> str:
+    """
+    Content address of a generated description: any change of the product name,
+    brand, prompt or model gives a new key.
+    """
+    payload = json.dumps([name, brand, system_prompt, model], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DescriptionCache:
+    """
+    Persistent store of generated descriptions keyed by description_key.
+    Least-recently-used entries are evicted once the stored text exceeds `max_bytes`.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS descriptions (
+                key         TEXT PRIMARY KEY,
+                name        TEXT NOT NULL,
+                brand       TEXT NOT NULL,
+                model       TEXT NOT NULL,
+                content     TEXT NOT NULL,
+                size        INTEGER NOT NULL,
+                created_at  REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS descriptions_accessed ON descriptions(accessed_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS descriptions_brand ON descriptions(brand)")
+        self._db.commit()
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM descriptions").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT content FROM descriptions WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            self._db.execute("UPDATE descriptions SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        return row[0]
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key: str, name: str, brand: str, model: str, content: str):
+        size = len(content.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM descriptions WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, name, brand, model, content, size, now, now),
+            )
+            self._total += size - (old[0] if old else 0)
+            while self._total > self.max_bytes:
+                row = self._db.execute(
+                    "SELECT key, size FROM descriptions ORDER BY accessed_at LIMIT 1"
+                ).fetchone()
+                if not row:
+                    self._total = 0
+                    break
+                self._db.execute("DELETE FROM descriptions WHERE key = ?", (row[0],))
+                self._total -= row[1]
+            self._db.commit()
+
+    def invalidate(self, brand: Optional[str] = None, name: Optional[str] = None) -> int:
+        """
+        Deletes entries of a brand and/or product name (everything when both are None).
+        Brand and name are compared case-insensitively.
+        """
+        where, params = [], []
+        if brand:
+            where.append("LOWER(brand) = LOWER(?)")
+            params.append(brand)
+        if name:
+            where.append("LOWER(name) = LOWER(?)")
+            params.append(name)
+        sql = "DELETE FROM descriptions" + (" WHERE " + " AND ".join(where) if where else "")
+        with self._lock:
+            removed = self._db.execute(sql, params).rowcount
+            self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM descriptions").fetchone()[0]
+            self._db.commit()
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+            total = self._total
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[DescriptionCache]:
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = DescriptionCache()
+        return _cache
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Кэш сгенерированных описаний")
+    sub = arg_parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="показать размер кэша")
+    inv = sub.add_parser("invalidate", help="удалить записи из кэша")
+    inv.add_argument("--brand", help="только для этого бренда")
+    inv.add_argument("--name", help="только для этого товара")
+    inv.add_argument("--all", action="store_true", help="очистить весь кэш")
+    args = arg_parser.parse_args()
+
+    cache = DescriptionCache()
+    if args.command == "stats":
+        stats = cache.stats()
+        print(f"📦 {stats['entries']} описаний, {stats['bytes'] / 1024:.0f} KiB в {CACHE_PATH}")
+    elif args.command == "invalidate":
+        if not (args.brand or args.name or args.all):
+            arg_parser.error("укажите --brand, --name или --all")
+        removed = cache.invalidate(brand=args.brand, name=args.name)
+        print(f"🗑 Удалено {removed} описаний")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+CACHE_PATH = os.getenv("HTTP_CACHE_PATH", os.path.join(".cache", "http_cache.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Seconds a stored page is served without asking the server at all (0 = always revalidate)
+CACHE_MAX_AGE = float(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+# Offline mode: serve only from the cache, never touch the network
+CACHE_OFFLINE = os.getenv("HTTP_CACHE_OFFLINE", "0") == "1"
+CACHE_ENABLED = os.getenv("HTTP_CACHE", "1") != "0"
+
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+class ResponseCache:
+    """
+    On-disk store of GET responses with their validators (ETag / Last-Modified).
+    Entries are evicted least-recently-used first once the total body size
+    exceeds `max_bytes`.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url         TEXT PRIMARY KEY,
+                body        BLOB NOT NULL,
+                headers     TEXT NOT NULL,
+                encoding    TEXT,
+                size        INTEGER NOT NULL,
+                fetched_at  REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+        self._db.commit()
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, url: str) -> "dict | None":
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, headers, encoding, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if not row:
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        body, headers, encoding, fetched_at = row
+        return {"url": url, "body": body, "headers": json.loads(headers),
+                "encoding": encoding, "fetched_at": fetched_at}
+
+    def put(self, url: str, resp: requests.Response):
+        headers = {h: resp.headers[h] for h in KEPT_HEADERS if h in resp.headers}
+        body = resp.content
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body, json.dumps(headers), resp.encoding or resp.apparent_encoding,
+                 len(body), now, now),
+            )
+            self._total += len(body) - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+
+    def revalidated(self, entry: dict, resp: requests.Response):
+        """
+        Marks a stored entry as fresh after a 304, picking up new validators if sent.
+        """
+        headers = dict(entry["headers"])
+        for h in ("ETag", "Last-Modified"):
+            if h in resp.headers:
+                headers[h] = resp.headers[h]
+        entry["headers"] = headers
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET headers = ?, fetched_at = ? WHERE url = ?",
+                (json.dumps(headers), time.time(), entry["url"]),
+            )
+            self._db.commit()
+
+    def _evict(self):
+        while self._total > self.max_bytes:
+            row = self._db.execute(
+                "SELECT url, size FROM responses ORDER BY accessed_at LIMIT 1"
+            ).fetchone()
+            if not row:
+                self._total = 0
+                break
+            self._db.execute("DELETE FROM responses WHERE url = ?", (row[0],))
+            self._total -= row[1]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._total = 0
+
+
+def is_fresh(entry: dict, max_age: float = CACHE_MAX_AGE) -> bool:
+    return max_age > 0 and time.time() - entry["fetched_at"] < max_age
+
+
+def conditional_headers(entry: dict) -> dict:
+    headers = {}
+    if "ETag" in entry["headers"]:
+        headers["If-None-Match"] = entry["headers"]["ETag"]
+    if "Last-Modified" in entry["headers"]:
+        headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+    return headers
+
+
+def to_response(entry: dict) -> requests.Response:
+    """
+    Rebuilds a requests.Response from a stored entry, so callers can't tell
+    a cache hit from a network response.
+    """
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.reason = "OK"
+    resp.url = entry["url"]
+    resp._content = entry["body"]
+    resp.headers = CaseInsensitiveDict(entry["headers"])
+    resp.encoding = entry["encoding"]
+    return resp
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> "ResponseCache | None":
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -0,0 +1,165 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from net_utils import safe_request
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "8"))
+# Largest width/height the shop keeps; 0 leaves images at their original size
+IMAGE_MAX_WIDTH = int(os.getenv("IMAGE_MAX_WIDTH", "0"))
+IMAGE_MAX_HEIGHT = int(os.getenv("IMAGE_MAX_HEIGHT", "0"))
+JPEG_QUALITY = 90
+
+MAGIC = {
+    b"\xff\xd8\xff": "jpg",
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"GIF8": "gif",
+    b"RIFF": "webp",
+}
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    for magic, ext in MAGIC.items():
+        if data.startswith(magic):
+            return ext
+    return None
+
+
+def to_jpeg(data: bytes, max_size: Tuple[int, int] = (0, 0)) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Verifies downloaded image bytes and turns them into a real JPEG, downscaled to
+    fit `max_size` when it is set. JPEGs that already fit are kept byte for byte.
+    Without Pillow images are only checked by signature and keep their own format.
+    Returns (bytes, extension) or (None, None) when the data is not an image.
+    """
+    fmt = sniff_format(data)
+    if Image is None:
+        return (data, fmt) if fmt else (None, None)
+
+    try:
+        Image.open(io.BytesIO(data)).verify()
+        img = Image.open(io.BytesIO(data))
+    except Exception:
+        return None, None
+
+    width, height = max_size
+    too_big = (width and img.width > width) or (height and img.height > height)
+    if img.format == "JPEG" and not too_big:
+        return data, "jpg"
+
+    if too_big:
+        img.thumbnail((width or img.width, height or img.height))
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue(), "jpg"
+
+
+class ImagePipeline:
+    """
+    Downloads product images concurrently ahead of upload into a local
+    content-addressed cache. Identical images share one file and a URL already in
+    the cache is never downloaded again; `paths` waits only for what is still running.
+    """
+
+    def __init__(self, cache_dir: str = IMAGE_CACHE_DIR, workers: int = IMAGE_WORKERS,
+                 max_size: Tuple[int, int] = (IMAGE_MAX_WIDTH, IMAGE_MAX_HEIGHT)):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._index: Dict[str, str] = {}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, encoding="utf-8") as f:
+                self._index = json.load(f)
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+
+    def prefetch(self, urls: Iterable[str]):
+        with self._lock:
+            for url in urls:
+                if url not in self._futures:
+                    self._futures[url] = self._pool.submit(self._fetch, url)
+
+    def paths(self, urls: List[str]) -> List[str]:
+        """
+        Local files for `urls` in order, skipping failed downloads and duplicate content.
+        """
+        self.prefetch(urls)
+        result = []
+        for url in urls:
+            path = self._futures[url].result()
+            if path and path not in result:
+                result.append(path)
+        return result
+
+    def _cached(self, url: str) -> Optional[str]:
+        with self._lock:
+            name = self._index.get(url)
+        path = os.path.join(self.cache_dir, name) if name else None
+        return path if path and os.path.exists(path) else None
+
+    def _fetch(self, url: str) -> Optional[str]:
+        path = self._cached(url)
+        if path:
+            return path
+
+        resp = safe_request(url, timeout=15, use_cache=False)
+        if not resp:
+            return None
+        data, ext = to_jpeg(resp.content, self.max_size)
+        if data is None:
+            print(f"⚠️ Не изображение: {url}")
+            return None
+
+        digest = hashlib.sha256(resp.content).hexdigest()
+        width, height = self.max_size
+        suffix = f"_{width}x{height}" if width or height else ""
+        name = f"{digest}{suffix}.{ext}"
+        path = os.path.join(self.cache_dir, name)
+        if not os.path.exists(path):
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        with self._lock:
+            self._index[url] = name
+            tmp = f"{self._index_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._index, f)
+            os.replace(tmp, self._index_path)
+        return path
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> ImagePipeline:
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = ImagePipeline()
+        return _pipeline
@@ -0,0 +1,157 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from openai import OpenAI
+
+# Statuses that mean the key itself is unusable (bad/disabled key, no credits, no access)
+KEY_FATAL_STATUSES = {401, 402, 403}
+# Status that means the model is gone for every key
+MODEL_FATAL_STATUSES = {404}
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        self.refill(now)
+        if self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class Route:
+    """
+    One key/model pair with its own rate limit and circuit breaker.
+    """
+
+    def __init__(self, key: str, model: str, rpm: float, burst: int):
+        self.key = key
+        self.model = model
+        self.bucket = TokenBucket(rpm, burst)
+        self.failures = 0
+        self.open_until = 0.0
+        self.cooldown = 0.0
+        self.latency = 0.0
+
+    def __repr__(self):
+        return f"{self.model} — ключ {self.key[:8]}..."
+
+
+class Lease:
+    """
+    A single reserved call on a route, handed back to RateScheduler.report.
+    """
+
+    def __init__(self, route: Route, client: OpenAI):
+        self.route = route
+        self.client = client
+        self.model = route.model
+        self.key = route.key
+        self.started = time.monotonic()
+
+
+class RateScheduler:
+    """
+    Sends each LLM call to the healthiest key/model pair that has rate budget left.
+    Pairs answering 429 or auth errors are taken out of rotation for a cooldown
+    that doubles on every consecutive failure; one OpenAI client is kept per key.
+    """
+
+    def __init__(self, keys: List[str], models: List[str], base_url: str,
+                 rpm: float = 20, burst: int = 2, cooldown: float = 30.0, max_cooldown: float = 900.0,
+                 failure_threshold: int = 3):
+        self.base_url = base_url
+        self.models = list(models)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failure_threshold = failure_threshold
+        self.routes = [Route(key, model, rpm, burst) for model in models for key in keys]
+        self._clients: Dict[str, OpenAI] = {}
+        self._cond = threading.Condition()
+
+    def client(self, key: str) -> OpenAI:
+        with self._cond:
+            if key not in self._clients:
+                self._clients[key] = OpenAI(api_key=key, base_url=self.base_url, max_retries=0)
+            return self._clients[key]
+
+    def _rank(self, route: Route) -> Tuple:
+        return (route.failures, self.models.index(route.model), -route.bucket.tokens, route.latency)
+
+    def acquire(self, max_wait: float = 120.0) -> Optional[Lease]:
+        """
+        Blocks until some pair may be called and reserves one request on it.
+        Returns None if nothing becomes available within `max_wait` seconds.
+        """
+        deadline = time.monotonic() + max_wait
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                ready_at = {r: max(r.open_until, r.bucket.ready_at(now)) for r in self.routes}
+                ready = [r for r, t in ready_at.items() if t <= now]
+                if ready:
+                    route = min(ready, key=self._rank)
+                    route.bucket.take()
+                    break
+                wake = min(ready_at.values())
+                if wake > deadline:
+                    return None
+                self._cond.wait(timeout=wake - now)
+
+        return Lease(route, self.client(route.key))
+
+    def report(self, lease: Lease, error: Optional[Exception] = None):
+        route = lease.route
+        with self._cond:
+            elapsed = time.monotonic() - lease.started
+            route.latency = elapsed if not route.latency else 0.8 * route.latency + 0.2 * elapsed
+            if error is None:
+                route.failures = 0
+                route.cooldown = 0.0
+            else:
+                route.failures += 1
+                status = getattr(error, "status_code", None)
+                if status in KEY_FATAL_STATUSES:
+                    for r in self.routes:
+                        if r.key == route.key:
+                            self._open(r, error, fatal=True)
+                elif status in MODEL_FATAL_STATUSES:
+                    for r in self.routes:
+                        if r.model == route.model:
+                            self._open(r, error, fatal=True)
+                elif status == 429 or route.failures >= self.failure_threshold:
+                    self._open(route, error, fatal=False)
+            self._cond.notify_all()
+
+    def _open(self, route: Route, error: Exception, fatal: bool):
+        if fatal:
+            route.cooldown = self.max_cooldown
+        else:
+            route.cooldown = min(self.max_cooldown, route.cooldown * 2 if route.cooldown else self.cooldown)
+        wait = route.cooldown
+        retry_after = _retry_after(error)
+        if retry_after is not None and not fatal:
+            wait = max(retry_after, 1.0)
+        route.open_until = time.monotonic() + wait
+        print(f"[WARN] {route} отключён на {wait:.0f} сек.")
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
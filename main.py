@@ -2,14 +2,38 @@ import os
 import sys
 import json
 import time
-
-from parser import collect_all_final_pages, get_product_details
-from uploader import start_upload
+import asyncio
+import argparse
+
+from parser import (
+    BASE_URL, collect_all_final_pages_async, get_products_parallel, set_extraction_limits, set_parse_pool,
+    attach_descriptions,
+)
+from product_store import JsonlWriter
+from catalog import get_catalog
+from crawl_checkpoint import CrawlCheckpoint
+from metrics import write_metrics
+from refresh import refresh_brand
+from uploader import UPLOAD_BACKEND, UPLOAD_WORKERS, start_upload
+from net_utils import request_stats
+from description_cache import get_cache as get_description_cache
 
 
 OUTPUT_DIR = "output"
 DETAILS_DIR = "product_details"
 
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "8"))
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "4"))
+CRAWL_DELAY = float(os.getenv("CRAWL_DELAY", "0.1"))
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "8"))
+EXTRACT_FETCH_LIMIT = int(os.getenv("EXTRACT_FETCH_LIMIT", "8"))
+EXTRACT_LLM_LIMIT = int(os.getenv("EXTRACT_LLM_LIMIT", "2"))
+PARSE_PROCESSES = int(os.getenv("PARSE_PROCESSES", "0"))
+
+# Products per LLM request; 1 keeps one request per product
+DESCRIPTION_BATCH_SIZE = int(os.getenv("DESCRIPTION_BATCH_SIZE", "1"))
+
 
 def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
@@ -20,24 +44,44 @@ def save_json(data, path):
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
-def collect_pages_flow():
+def print_request_stats():
+    stats = request_stats()
+    print(
+        f"🌐 HTTP: {stats['requests']} запросов, {stats['errors']} ошибок, {stats['retries']} повторов, "
+        f"{stats['wire_bytes'] / 1024:.0f} KiB передано ({stats['bytes'] / 1024:.0f} KiB распаковано), "
+        f"в среднем {stats['avg_seconds'] * 1000:.0f} мс, "
+        f"кэш: {stats['cache_hits']} локально, {stats['not_modified']} не изменилось (304)"
+    )
+
+
+def collect_pages_flow(args):
     brand = input("🔤 Введите название бренда (например: Sidi, Furygan): ").strip()
-    start_url = f"https://www.jopa.nl/en/{brand.lower()}"
+    start_url = f"{BASE_URL}/en/{brand.lower()}"
+
+    checkpoint = CrawlCheckpoint(os.path.join(OUTPUT_DIR, f"{brand.lower()}_crawl_state.json"), start_url)
+    if not args.resume:
+        checkpoint.remove()
 
     print(f"\n🔍 Сбор конечных страниц для бренда: {brand}")
     t0 = time.time()
 
-    pages = collect_all_final_pages(start_url, brand)
+    pages = asyncio.run(collect_all_final_pages_async(
+        start_url, brand,
+        workers=CRAWL_WORKERS, per_host=CRAWL_PER_HOST, delay=CRAWL_DELAY,
+        checkpoint=checkpoint,
+    ))
     print(f"📄 Найдено {len(pages)} страниц за {time.time() - t0:.2f} сек.")
+    print_request_stats()
 
     ensure_dir(OUTPUT_DIR)
     out_path = os.path.join(OUTPUT_DIR, f"{brand.lower()}_final_pages.json")
     save_json(pages, out_path)
+    checkpoint.remove()
 
     print(f"✅ Ссылки сохранены в {out_path}")
 
 
-def get_products_flow():
+def get_products_flow(args):
     brand = input("🔤 Введите название бренда: ").strip().lower()
     pages_file = os.path.join(OUTPUT_DIR, f"{brand}_final_pages.json")
 
@@ -48,37 +92,104 @@ def get_products_flow():
     with open(pages_file, "r", encoding="utf-8") as f:
         pages = json.load(f)
 
-    print(f"📄 Обрабатываем {len(pages)} страниц...")
-    products = []
-    for i, url in enumerate(pages, 1):
-        print(f"  {i}/{len(pages)}: {url}")
-        products.append(get_product_details(brand, url))
-
     ensure_dir(DETAILS_DIR)
-    out_path = os.path.join(DETAILS_DIR, f"{brand}_products.json")
-    save_json(products, out_path)
-    print(f"✅ Данные сохранены в {out_path}")
-
-
-def upload_flow():
+    out_path = os.path.join(DETAILS_DIR, f"{brand}_products.jsonl")
+    writer = JsonlWriter(out_path, resume=args.resume)
+    catalog = get_catalog()
+    if not args.resume:
+        # Новое извлечение заменяет записи бренда и в каталоге, как и в JSONL
+        catalog.forget(brand)
+    todo = [url for url in pages if url not in writer.done_urls]
+    if len(todo) < len(pages):
+        print(f"↻ Пропускаем {len(pages) - len(todo)} уже сохранённых страниц")
+
+    print(f"📄 Обрабатываем {len(todo)} страниц...")
+    set_extraction_limits(fetch=EXTRACT_FETCH_LIMIT, llm=EXTRACT_LLM_LIMIT)
+    set_parse_pool(PARSE_PROCESSES)
+    batched = DESCRIPTION_BATCH_SIZE > 1
+    pending, written = [], 0
+
+    def flush(products):
+        nonlocal written
+        if batched:
+            products = attach_descriptions(products, brand, batch_size=DESCRIPTION_BATCH_SIZE)
+        for product in products:
+            writer.write(product)
+        catalog.put_many(products, brand)
+        written += len(products)
+
+    try:
+        for n, (_, url, product) in enumerate(
+                get_products_parallel(brand, todo, workers=EXTRACT_WORKERS, describe=not batched, ordered=False), 1):
+            print(f"  {n}/{len(todo)}: {url}")
+            if not product:
+                continue
+            pending.append(product)
+            if not batched or len(pending) >= DESCRIPTION_BATCH_SIZE:
+                flush(pending)
+                pending = []
+        flush(pending)
+    finally:
+        set_parse_pool(0)
+        writer.close()
+    print_request_stats()
+
+    description_cache = get_description_cache()
+    if description_cache:
+        stats = description_cache.stats()
+        print(f"🧠 Кэш описаний: {stats['hits']} попаданий, {stats['misses']} промахов, {stats['entries']} записей")
+
+    print(f"✅ {written} товаров дописано в {out_path}")
+
+
+def upload_flow(args):
     brand = input("🔤 Введите название бренда: ").strip().lower()
     brand = brand.replace(" ", "-")
-    details_file = os.path.join(DETAILS_DIR, f"{brand}_products.json")
-
+    catalog = get_catalog()
+    details_file = os.path.join(DETAILS_DIR, f"{brand}_products.jsonl")
     if not os.path.exists(details_file):
+        details_file = os.path.join(DETAILS_DIR, f"{brand}_products.json")
+
+    if catalog.category_urls(brand):
+        details_file = None
+        print(f"🚀 Запуск загрузки из каталога {catalog.path}...")
+    elif not os.path.exists(details_file):
         print(f"❌ Файл {details_file} не найден.")
         sys.exit(1)
-
-    print(f"🚀 Запуск загрузки из {details_file}...")
-    start_upload(details_file, brand.replace("-", " ").upper())
+    else:
+        print(f"🚀 Запуск загрузки из {details_file}...")
+    start_upload(details_file, brand.replace("-", " ").upper(), backend=UPLOAD_BACKEND, workers=UPLOAD_WORKERS)
     print("✅ Загрузка завершена")
 
 
+def refresh_flow(args):
+    brand = input("🔤 Введите название бренда: ").strip().lower().replace(" ", "-")
+    set_extraction_limits(fetch=EXTRACT_FETCH_LIMIT)
+    counts = refresh_brand(brand, workers=EXTRACT_WORKERS)
+    if counts is None:
+        sys.exit(1)
+    print_request_stats()
+    print(f"✅ Цены и наличие обновлены: создано {counts['create']}, обновлено {counts['update']}, "
+          f"без изменений {counts['skip']} товаров"
+          + (f", с ошибкой {counts['failed']}" if counts["failed"] else "")
+          + (f", без описания {counts['no_description']}" if counts["no_description"] else "")
+          + (f", ждут полной загрузки {counts['full_upload']}" if counts["full_upload"] else ""))
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="jopa.nl → motobuzz.lv product importer")
+    arg_parser.add_argument("--resume", action="store_true",
+                        help="продолжить прерванный обход/извлечение с того места, где остановились")
+    return arg_parser.parse_args()
+
+
 def main():
+    args = parse_args()
     actions = {
         "1": ("Собрать ссылки на страницы", collect_pages_flow),
         "2": ("Получить JSON продуктов", get_products_flow),
         "3": ("Загрузить на сайт", upload_flow),
+        "4": ("Обновить цены и наличие", refresh_flow),
     }
 
     print("Выберите действие:")
@@ -92,7 +203,10 @@ def main():
         sys.exit(1)
 
     _, func = action
-    func()
+    try:
+        func(args)
+    finally:
+        write_metrics(func.__name__.replace("_flow", ""))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+"""
+Process-wide counters and latency histograms for one run, exported as a JSON
+run report and in the Prometheus text format.
+
+    from metrics import inc, observe, timer
+    inc("http_requests_total", host="www.jopa.nl", status="200")
+    with timer("parse_seconds", kind="product"):
+        ...
+
+Metric names follow Prometheus conventions (_total counters, _seconds
+histograms) and get the "importer_" prefix on export.
+"""
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join("output", "metrics"))
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+PREFIX = "importer_"
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Samples kept per histogram for the report's percentiles (uniform reservoir)
+RESERVOIR_SIZE = 4096
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples: List[float] = []
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < RESERVOIR_SIZE:
+                self.samples[slot] = value
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class Registry:
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def report(self) -> Dict[str, object]:
+        """
+        JSON-ready snapshot: every counter and histogram summary with its labels,
+        plus the total seconds each histogram accounts for, largest first.
+        """
+        with self._lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self._counters.items())]
+            histograms = [{"name": n, "labels": dict(l), **h.summary()}
+                          for (n, l), h in sorted(self._histograms.items())]
+        time_by_metric: Dict[str, float] = {}
+        for h in histograms:
+            time_by_metric[h["name"]] = time_by_metric.get(h["name"], 0.0) + h["sum"]
+        return {
+            "started_at": self.started,
+            "seconds": round(time.time() - self.started, 3),
+            "time_by_metric": dict(sorted(time_by_metric.items(), key=lambda kv: -kv[1])),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def prometheus(self) -> str:
+        def fmt(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+            pairs = list(labels) + ([extra] if extra else [])
+            if not pairs:
+                return ""
+            escaped = ",".join(f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                               for k, v in pairs)
+            return "{" + escaped + "}"
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}{name} counter")
+                    typed.add(name)
+                lines.append(f"{PREFIX}{name}{fmt(labels)} {value:g}")
+            for (name, labels), hist in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}{name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(BUCKETS, hist.counts):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket{fmt(labels, ('le', f'{bound:g}'))} {cumulative}")
+                lines.append(f"{PREFIX}{name}_bucket{fmt(labels, ('le', '+Inf'))} {hist.count}")
+                lines.append(f"{PREFIX}{name}_sum{fmt(labels)} {hist.sum:.6f}")
+                lines.append(f"{PREFIX}{name}_count{fmt(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+
+REGISTRY = Registry()
+
+
+def inc(name: str, value: float = 1, **labels):
+    if METRICS_ENABLED:
+        REGISTRY.inc(name, value, **labels)
+
+
+def observe(name: str, seconds: float, **labels):
+    if METRICS_ENABLED:
+        REGISTRY.observe(name, seconds, **labels)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def write_reports(run_name: str, directory: str = METRICS_DIR) -> Optional[Tuple[str, str]]:
+    """
+    Writes <run_name>-<timestamp>.json and .prom into `directory`.
+    Returns both paths, or None when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{run_name}-{time.strftime('%Y%m%d-%H%M%S')}")
+    report = REGISTRY.report()
+    report["run"] = run_name
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    with open(base + ".prom", "w", encoding="utf-8") as f:
+        f.write(REGISTRY.prometheus())
+    return base + ".json", base + ".prom"
+
+
+def print_summary(limit: int = 8):
+    """
+    Prints where the run's time went: the histograms with the largest total time.
+    """
+    report = REGISTRY.report()
+    print(f"📊 Время по метрикам (прогон {report['seconds']:.1f} сек.):")
+    for name, seconds in list(report["time_by_metric"].items())[:limit]:
+        print(f"  {name}: {seconds:.1f} сек.")
+
+
+def write_metrics(run_name: str):
+    """
+    Prints where the run's time went and saves the JSON/Prometheus metric reports.
+    """
+    paths = write_reports(run_name)
+    if paths:
+        print_summary()
+        print(f"📊 Метрики: {paths[0]}, {paths[1]}")
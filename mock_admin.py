@@ -0,0 +1,327 @@
+"""
+Local stand-in for the motobuzz.lv admin, for running the upload path offline.
+
+It serves the markup the uploader relies on (login form, add-product modal,
+x-editable anchors with data-url/data-pk/data-source, description forms,
+gallery/variant/related-product tabs, availability) and keeps everything in memory.
+GET /admin/_state returns the stored products as JSON.
+
+    python mock_admin.py --port 8800
+    MOTOBUZZ_ADMIN_URL=http://127.0.0.1:8800/admin/ UPLOAD_BACKEND=http python main.py
+"""
+import argparse
+import html
+import json
+import re
+import secrets
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CATEGORY = "/admin/kategorie-1929"
+BRANDS = ["SIDI", "FURYGAN", "FLY", "RUSTY STITCHES", "KEK", "LOL"]
+# Rows the "podobné" filter shows at once, like the admin's paginated result table
+FILTER_PAGE_SIZE = 50
+PRICE_SOURCES = [{"value": "0", "text": "cenu určuje kategorie"}, {"value": "1", "text": "cenu určuje zboží"}]
+
+
+class MockAdmin:
+    def __init__(self, username: str = "admin", password: str = "admin",
+                 brands=None, latency: float = 0.0):
+        self.username = username
+        self.password = password
+        self.brands = {str(i + 1): b for i, b in enumerate(brands or BRANDS)}
+        self.latency = latency
+        self.sessions = set()
+        self.products = {}
+        self.lock = threading.Lock()
+        self._next_id = 1000
+
+    def create(self, name: str, price: str) -> str:
+        with self.lock:
+            self._next_id += 1
+            ext = str(self._next_id)
+            self.products[ext] = {
+                "external_id": ext, "pk": str(self._next_id + 50000), "nazev": name, "cena": price,
+                "fields": {}, "popis": "", "popis2": "", "images": [], "variants": [],
+                "dostupnost": None, "podobne": [],
+            }
+            return ext
+
+    def by_pk(self, pk: str):
+        for prod in self.products.values():
+            if prod["pk"] == pk or prod["external_id"] == pk:
+                return prod
+        return None
+
+    def state(self) -> dict:
+        with self.lock:
+            return json.loads(json.dumps(self.products))
+
+
+def _layout(body: str) -> str:
+    return f'<html><body><div class="sidebar"><a href="{CATEGORY}">Zboží</a></div>{body}</body></html>'
+
+
+def _inline(name: str, pk: str, value: str, source=None) -> str:
+    src = f" data-source='{html.escape(json.dumps(source, ensure_ascii=False), quote=True)}'" if source else ""
+    return (f'<a href="#" class="inlineedit editable editable-click" data-name="{name}" data-pk="{pk}" '
+            f'data-url="/admin/inline"{src}>{html.escape(value or "")}</a>')
+
+
+def _product_page(admin: MockAdmin, prod: dict) -> str:
+    ext, pk, base = prod["external_id"], prod["pk"], f"{CATEGORY}/zbozi-{prod['external_id']}"
+    f = prod["fields"]
+    brand_source = [{"value": k, "text": v} for k, v in admin.brands.items()]
+    return _layout(f"""
+<ul class="nav">
+  <li><a data-presenter="zbozi_detail" href="{base}">Detail</a></li>
+  <li><a data-presenter="img_galerie" href="{base}?presenter=img_galerie">Galerie</a></li>
+  <li><a data-presenter="zbozi_varianty" href="{base}?presenter=zbozi_varianty">Varianty</a></li>
+  <li><a data-presenter="zbozi_podobne" href="{base}?presenter=zbozi_podobne">Podobné</a></li>
+</ul>
+<h1>{html.escape(prod['nazev'])}</h1>
+<table>
+ <tr><td>Kód</td><td>{_inline('CPolozka.code', pk, 'P' + pk)}</td></tr>
+ <tr><td>EAN</td><td>{_inline('CPolozka.ean', pk, f.get('CPolozka.ean', ''))}</td></tr>
+ <tr><td>Cena</td><td>{_inline('CPolozka.cena', pk, f.get('CPolozka.cena', prod['cena']))}</td></tr>
+ <tr><td>Dodavatel URL</td><td>{_inline('CZbozi.dodavatelurl', ext, f.get('CZbozi.dodavatelurl', ''))}</td></tr>
+ <tr><td>Výrobce</td><td>{_inline('CZbozi.vyrobce_id', ext, admin.brands.get(f.get('CZbozi.vyrobce_id'), ''), brand_source)}</td></tr>
+ <tr><td>Zdroj ceny</td><td>{_inline('CZbozi.zdrojceny', ext, '', PRICE_SOURCES)}</td></tr>
+</table>
+<h4 data-for="zbozi.popis-{ext}">Popis</h4>
+<form method="post" action="{base}/texty"><textarea id="zbozi.popis-{ext}" name="popis">{html.escape(prod['popis'])}</textarea></form>
+<h4 data-for="zbozi.popis2-{ext}">Popis 2</h4>
+<form method="post" action="{base}/texty"><textarea id="zbozi.popis2-{ext}" name="popis2">{html.escape(prod['popis2'])}</textarea></form>
+<a class="dostupnost btn btn-xs btn-info" href="#">Dostupnost</a>
+<form method="post" action="{base}/dostupnost">
+  <select id="dostupnost" name="dostupnost"><option value="0">---</option><option value="1">skladem</option></select>
+  <a class="nastavit btn btn-xs btn-success" href="#">Nastavit</a>
+</form>
+""")
+
+
+def _gallery_page(prod: dict) -> str:
+    base = f"{CATEGORY}/zbozi-{prod['external_id']}"
+    images = "".join(f'<div class="galerie_telo">{html.escape(i["name"])}</div>' for i in prod["images"])
+    return _layout(f"""
+<div class="galerie_container">
+  <form method="post" action="{base}/galerie" enctype="multipart/form-data">
+    <input type="file" name="upload[]" multiple class="hidden">
+  </form>
+  <div class="galerie_upload">{images}</div>
+</div>""")
+
+
+def _variants_page(prod: dict) -> str:
+    base = f"{CATEGORY}/zbozi-{prod['external_id']}"
+    rows = "".join(
+        f'<tr><td><a class="inlineedit editable editable-click" data-name="CPolozka.nazev">{html.escape(v)}</a></td></tr>'
+        for v in prod["variants"])
+    return _layout(f"""
+<a class="pridat btn btn-xs btn-success" href="#">Přidat</a>
+<form class="modal" method="post" action="{base}/varianty">
+  <input id="nazev" name="nazev">
+  <div class="modal-footer"><button type="submit">Uložit</button></div>
+</form>
+<table class="varianty">{rows}</table>""")
+
+
+def _podobne_page(admin: MockAdmin, prod: dict, query: str) -> str:
+    base = f"{CATEGORY}/zbozi-{prod['external_id']}"
+    linked = "".join(f'<tr class="podobny"><td class="kod">P{pk}</td></tr>' for pk in prod["podobne"])
+    found = []
+    if query:
+        found = [p for p in admin.products.values()
+                 if query.lower() in f"P{p['pk']} {p['nazev']}".lower()][:FILTER_PAGE_SIZE]
+    rows = "".join(
+        f'<tr><td><label><input type="checkbox" class="ace zatrhnout" name="podobne[]" value="{p["pk"]}">'
+        f'<span class="lbl"></span></label></td><td class="kod">P{p["pk"]}</td><td>{html.escape(p["nazev"])}</td></tr>'
+        for p in found)
+    return _layout(f"""
+<div class="widget-main padding-8">
+  <table class="podobne">{linked}</table>
+  <label><input type="radio" name="zpusob" value="filtr"><span class="lbl"> vybrat přes filtr</span></label>
+  <form class="filtr" method="get" action="{base}">
+    <input type="hidden" name="presenter" value="zbozi_podobne">
+    <input id="hledat" name="hledat" value="{html.escape(query, quote=True)}">
+    <button class="btn btn-primary filtrovat" type="submit">Filtrovat</button>
+  </form>
+  <form class="vyber" method="post" action="{base}/podobne">
+    <table class="produkty">{rows}</table>
+    <div class="table-footer"><a class="vyber btn btn-xs btn-success" href="#">Vybrat</a></div>
+  </form>
+</div>""")
+
+
+def _category_page(admin: MockAdmin) -> str:
+    rows = "".join(
+        f'<tr><td><a href="{CATEGORY}/zbozi-{p["external_id"]}">{html.escape(p["nazev"])}</a></td></tr>'
+        for p in admin.products.values())
+    return _layout(f"""
+<a class="pridat btn btn-xs btn-success" href="#">Přidat</a>
+<form class="modal" method="post" action="{CATEGORY}/pridat">
+  <input type="hidden" name="_token" value="mock">
+  <input id="nazev" name="nazev"><input id="cena" name="cena">
+  <div class="modal-footer"><button type="submit">Uložit</button></div>
+</form>
+<table>{rows}</table>""")
+
+
+LOGIN_PAGE = """<html><body><form method="post" action="/admin/login_check">
+<input type="hidden" name="_csrf_token" value="mock">
+<input name="_username"><input name="_password" type="password">
+<button type="submit">Přihlásit</button></form></body></html>"""
+
+
+def make_handler(admin: MockAdmin):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: str = "", ctype: str = "text/html; charset=utf-8", headers=None):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _redirect(self, location: str, headers=None):
+            self._send(302, "", headers={"Location": location, **(headers or {})})
+
+        def _logged_in(self) -> bool:
+            cookie = self.headers.get("Cookie", "")
+            return any(c.strip().startswith("MOCKSESSID=") and c.strip()[11:] in admin.sessions
+                       for c in cookie.split(";"))
+
+        def _form(self) -> dict:
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            ctype = self.headers.get("Content-Type", "")
+            if ctype.startswith("multipart/form-data"):
+                msg = BytesParser(policy=HTTP).parsebytes(
+                    b"Content-Type: " + ctype.encode() + b"\r\n\r\n" + raw)
+                form = {}
+                for part in msg.iter_parts():
+                    name = part.get_param("name", header="content-disposition")
+                    filename = part.get_filename()
+                    payload = part.get_payload(decode=True) or b""
+                    value = {"name": filename, "size": len(payload)} if filename else payload.decode("utf-8")
+                    form.setdefault(name, []).append(value)
+                return form
+            return parse_qs(raw.decode("utf-8"), keep_blank_values=True)
+
+        def do_GET(self):
+            if admin.latency:
+                time.sleep(admin.latency)
+            url = urlparse(self.path)
+            if url.path == "/admin/_state":
+                return self._send(200, json.dumps(admin.state(), ensure_ascii=False), "application/json")
+            if not self._logged_in():
+                if url.path.rstrip("/") == "/admin":
+                    return self._send(200, LOGIN_PAGE)
+                return self._redirect("/admin/")
+            if url.path.rstrip("/") == "/admin":
+                return self._send(200, _layout("<h1>Admin</h1>"))
+            if url.path == CATEGORY:
+                return self._send(200, _category_page(admin))
+
+            m = re.fullmatch(rf"{CATEGORY}/zbozi-(\d+)", url.path)
+            prod = admin.products.get(m.group(1)) if m else None
+            if not prod:
+                return self._send(404, "not found")
+            query = parse_qs(url.query)
+            presenter = query.get("presenter", [""])[0]
+            pages = {
+                "img_galerie": lambda: _gallery_page(prod),
+                "zbozi_varianty": lambda: _variants_page(prod),
+                "zbozi_podobne": lambda: _podobne_page(admin, prod, query.get("hledat", [""])[0]),
+            }
+            return self._send(200, pages.get(presenter, lambda: _product_page(admin, prod))())
+
+        def do_POST(self):
+            if admin.latency:
+                time.sleep(admin.latency)
+            url = urlparse(self.path)
+            form = self._form()
+            first = {k: v[0] for k, v in form.items()}
+
+            if url.path == "/admin/login_check":
+                if first.get("_username") == admin.username and first.get("_password") == admin.password:
+                    token = secrets.token_hex(8)
+                    admin.sessions.add(token)
+                    return self._redirect("/admin/", {"Set-Cookie": f"MOCKSESSID={token}; Path=/"})
+                return self._send(200, LOGIN_PAGE)
+            if not self._logged_in():
+                return self._send(403, "login required")
+
+            if url.path == f"{CATEGORY}/pridat":
+                ext = admin.create(first.get("nazev", ""), first.get("cena", ""))
+                return self._redirect(f"{CATEGORY}/zbozi-{ext}")
+
+            if url.path == "/admin/inline":
+                with admin.lock:
+                    prod = admin.by_pk(first.get("pk", ""))
+                    if not prod:
+                        return self._send(404, json.dumps({"error": "unknown pk"}), "application/json")
+                    prod["fields"][first.get("name")] = first.get("value", "")
+                return self._send(200, json.dumps({"success": True}), "application/json")
+
+            m = re.fullmatch(rf"{CATEGORY}/zbozi-(\d+)/(\w+)", url.path)
+            prod = admin.products.get(m.group(1)) if m else None
+            if not prod:
+                return self._send(404, "not found")
+            action = m.group(2)
+            with admin.lock:
+                if action == "texty":
+                    for key in ("popis", "popis2"):
+                        if key in first:
+                            prod[key] = first[key]
+                elif action == "galerie":
+                    prod["images"].extend(form.get("upload[]", []))
+                elif action == "varianty":
+                    prod["variants"].append(first.get("nazev", ""))
+                elif action == "dostupnost":
+                    prod["dostupnost"] = first.get("dostupnost")
+                elif action == "podobne":
+                    # Duplicates are kept, so links added twice show up in /admin/_state
+                    prod["podobne"].extend(form.get("podobne[]", []))
+                else:
+                    return self._send(404, "not found")
+            return self._redirect(f"{CATEGORY}/zbozi-{prod['external_id']}")
+
+    return Handler
+
+
+def serve(admin: MockAdmin, host: str = "127.0.0.1", port: int = 8800) -> ThreadingHTTPServer:
+    """
+    Starts the mock admin in a background thread and returns the server.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(admin))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Mock motobuzz.lv admin")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8800)
+    arg_parser.add_argument("--username", default="admin")
+    arg_parser.add_argument("--password", default="admin")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="задержка на запрос, сек.")
+    args = arg_parser.parse_args()
+
+    admin = MockAdmin(args.username, args.password, latency=args.latency)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(admin))
+    print(f"🧪 Mock admin: http://{args.host}:{args.port}/admin/ ({args.username}/{args.password})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,164 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
+
+import http_cache
+import metrics
+
+HEADERS = {"User-Agent": "Mozilla/5.0", "Accept-Encoding": "gzip, deflate"}
+
+POOL_SIZE = 32
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "errors": 0, "retries": 0, "bytes": 0, "wire_bytes": 0, "seconds": 0.0,
+          "cache_hits": 0, "not_modified": 0}
+
+
+def new_session() -> requests.Session:
+    """
+    Keep-alive session with a sized connection pool and the default headers.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the shared keep-alive session used for every outgoing request.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = new_session()
+        return _session
+
+
+def _retry_delay(attempt: int, resp: "requests.Response | None") -> float:
+    """
+    Honors Retry-After (seconds or HTTP date) when the server sends it,
+    otherwise uses exponential backoff with full jitter.
+    """
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX, max(0.0, float(retry_after)))
+        except ValueError:
+            try:
+                delta = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                return min(BACKOFF_MAX, max(0.0, delta))
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _record(url: str, seconds: float, resp: "requests.Response | None" = None, retry: bool = False):
+    host = urlparse(url).netloc
+    status = str(resp.status_code) if resp is not None else "error"
+    metrics.inc("http_requests_total", host=host, status=status)
+    metrics.observe("http_request_seconds", seconds, host=host)
+    if retry:
+        metrics.inc("http_retries_total", host=host)
+    wire = 0
+    if resp is not None:
+        try:
+            wire = resp.raw.tell()
+        except (AttributeError, ValueError):
+            wire = len(resp.content)
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["seconds"] += seconds
+        _stats["retries"] += int(retry)
+        if resp is None:
+            _stats["errors"] += 1
+        else:
+            _stats["bytes"] += len(resp.content)
+            _stats["wire_bytes"] += wire
+    if resp is not None:
+        metrics.inc("http_bytes_total", len(resp.content), host=host, encoding="decoded")
+        metrics.inc("http_bytes_total", wire, host=host, encoding="wire")
+
+
+def _count(key: str, url: str):
+    with _stats_lock:
+        _stats[key] += 1
+    metrics.inc("http_cache_total", host=urlparse(url).netloc, result=key)
+
+
+def request_stats() -> dict:
+    """
+    Snapshot of the request accounting: count, errors, retries,
+    decoded/transferred bytes, total/average latency, local cache hits and 304s.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["avg_seconds"] = stats["seconds"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
 
-HEADERS = {"User-Agent": "Mozilla/5.0"}
 
-def safe_request(url: str, timeout: int = 10) -> "requests.Response | None":
+def safe_request(url: str, timeout: int = 10, retries: int = MAX_RETRIES,
+                 use_cache: bool = True) -> "requests.Response | None":
     """
-    Making a GET request to the given URL with a timeout.
+    Making a GET request to the given URL with a timeout through the shared session.
+    Connection errors, 429 and 5xx responses are retried with backoff.
+    Pages are kept in the on-disk cache and revalidated with If-None-Match /
+    If-Modified-Since; fresh entries (or any entry in offline mode) skip the network.
     If the request fails, it returns None and prints an error message.
     """
-    try:
-        resp = requests.get(url, headers=HEADERS, timeout=timeout)
-        resp.raise_for_status()
-        return resp
-    except requests.RequestException as e:
-        print(f"⚠️ Ошибка запроса {url}: {e}")
+    cache = http_cache.get_cache() if use_cache else None
+    entry = cache.get(url) if cache else None
+    if entry and (http_cache.CACHE_OFFLINE or http_cache.is_fresh(entry)):
+        _count("cache_hits", url)
+        return http_cache.to_response(entry)
+    if cache and http_cache.CACHE_OFFLINE:
+        print(f"⚠️ Нет в кэше (offline): {url}")
         return None
+
+    headers = http_cache.conditional_headers(entry) if entry else None
+    session = get_session()
+    for attempt in range(retries + 1):
+        t0 = time.perf_counter()
+        try:
+            resp = session.get(url, timeout=timeout, headers=headers)
+        except requests.RequestException as e:
+            _record(url, time.perf_counter() - t0, retry=attempt < retries)
+            if attempt < retries:
+                time.sleep(_retry_delay(attempt, None))
+                continue
+            print(f"⚠️ Ошибка запроса {url}: {e}")
+            return None
+
+        retry = resp.status_code in RETRY_STATUSES and attempt < retries
+        _record(url, time.perf_counter() - t0, resp, retry=retry)
+        if retry:
+            time.sleep(_retry_delay(attempt, resp))
+            continue
+
+        if resp.status_code == 304 and entry:
+            _count("not_modified", url)
+            cache.revalidated(entry, resp)
+            return http_cache.to_response(entry)
+
+        try:
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            print(f"⚠️ Ошибка запроса {url}: {e}")
+            return None
+        if cache and resp.status_code == 200:
+            cache.put(url, resp)
+        return resp
@@ -1,73 +1,371 @@
+import os
 import re
+import asyncio
+import threading
 from collections import deque
-from typing import List, Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, as_completed
+from typing import List, Optional, Dict, Any, Tuple, Callable
+from urllib.parse import urlparse
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+import metrics
 from net_utils import safe_request
-from ai_description import generate_description
+from crawl_checkpoint import CrawlCheckpoint
+from ai_description import (
+    generate_description, generate_descriptions_batch, cached_description, DESCRIPTION_FORMAT
+)
 
-BASE_URL = "https://www.jopa.nl"
+# Supplier site; pointed at a local copy by the benchmark (bench.py)
+BASE_URL = os.getenv("JOPA_BASE_URL", "https://www.jopa.nl")
 
 
-def collect_all_final_pages(start_url: str, brand: str) -> List[str]:
-    visited, queue, final_pages = set(), deque([start_url]), []
-    brand_pattern = f"/en/{brand.lower()}/"
+def _class_strainer(*classes: str) -> SoupStrainer:
+    """
+    Keeps elements having any of `classes` among their class tokens. A list passed
+    as class_ matches the whole attribute value, so bs4 would drop "shopTegel col-6".
+    """
+    wanted = set(classes)
+    return SoupStrainer(class_=lambda value: bool(value) and any(t in wanted for t in value.split()))
 
-    while queue:
-        url = queue.popleft()
-        if url in visited:
-            continue
-        visited.add(url)
 
-        resp = safe_request(url)
-        if not resp:
-            continue
+# Only the subtrees the extractors read are built; everything else is skipped while parsing
+CATEGORY_STRAINER = _class_strainer("shopTegel", "nummer")
+PRODUCT_STRAINER = _class_strainer("omschrijving", "carousel-cell-groot", "displayprijs", "EANnummer")
+PRICE_STRAINER = _class_strainer("displayprijs", "EANnummer")
+
+# Separate limits for page fetches and LLM calls made by extraction workers
+_fetch_slots = threading.BoundedSemaphore(8)
+_llm_slots = threading.BoundedSemaphore(2)
+
+
+def set_extraction_limits(fetch: Optional[int] = None, llm: Optional[int] = None):
+    global _fetch_slots, _llm_slots
+    if fetch:
+        _fetch_slots = threading.BoundedSemaphore(fetch)
+    if llm:
+        _llm_slots = threading.BoundedSemaphore(llm)
+
+
+def _fetch(url: str):
+    with _fetch_slots:
+        return safe_request(url)
+
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+def set_parse_pool(processes: int = 0):
+    """
+    Moves HTML parsing of category/product pages to a pool of `processes` worker
+    processes (0 parses in the calling thread).
+    """
+    global _parse_pool
+    if _parse_pool:
+        _parse_pool.shutdown()
+    _parse_pool = ProcessPoolExecutor(max_workers=processes) if processes > 0 else None
+
 
-        soup = BeautifulSoup(resp.text, "html.parser")
+def _parse(func, html: str):
+    with metrics.timer("parse_seconds", kind=func.__name__):
+        if _parse_pool:
+            return _parse_pool.submit(func, html).result()
+        return func(html)
 
-        if soup.select_one("div.artikel"):
-            final_pages.append(url)
 
+# (brand, product_url, describe) -> Future with the product-page fields, shared by every
+# category page linking to it; cleared when an extraction run ends
+_product_memo: Dict[Tuple[str, str, bool], Future] = {}
+_product_memo_lock = threading.Lock()
+
+
+def _parse_listing(html: str, brand_pattern: str) -> Tuple[bool, List[str]]:
+    """
+    Parses a crawled page: returns whether it is a final page (has div.artikel)
+    and the absolute brand links found on it.
+    """
+    with metrics.timer("parse_seconds", kind="listing"):
+        soup = BeautifulSoup(html, HTML_PARSER)
+        links = []
         for a in soup.select(f"a[href*='{brand_pattern}']"):
             href = a.get("href")
             if href:
-                full = href if href.startswith("http") else BASE_URL + href
-                if full not in visited:
-                    queue.append(full)
+                links.append(href if href.startswith("http") else BASE_URL + href)
+        is_final = bool(soup.select_one("div.artikel"))
+    metrics.inc("crawl_pages_total", final=str(is_final).lower())
+    return is_final, links
+
+
+def collect_all_final_pages(start_url: str, brand: str,
+                            checkpoint: Optional[CrawlCheckpoint] = None) -> List[str]:
+    visited, queue, final_pages = set(), deque([start_url]), []
+    brand_pattern = f"/en/{brand.lower()}/"
+
+    state = checkpoint.load() if checkpoint else None
+    if state:
+        visited, queue, final_pages = set(state["visited"]), deque(state["frontier"]), state["final_pages"]
+        print(f"↻ Продолжаем обход: {len(visited)} посещено, {len(queue)} в очереди")
+
+    visited_order = list(state["visited"]) if state else []
+    try:
+        while queue:
+            url = queue[0]
+            if url in visited:
+                queue.popleft()
+                continue
+
+            resp = safe_request(url)
+            queue.popleft()
+            visited.add(url)
+            visited_order.append(url)
+            if resp:
+                is_final, links = _parse_listing(resp.text, brand_pattern)
+                if is_final:
+                    final_pages.append(url)
+
+                for full in links:
+                    if full not in visited:
+                        queue.append(full)
+
+            if checkpoint and checkpoint.due():
+                checkpoint.write(visited_order, list(queue), final_pages)
+    finally:
+        if checkpoint:
+            checkpoint.write(visited_order, list(queue), final_pages)
 
     return final_pages
 
 
-def parse_product_page(brand, url: str) -> Optional[Dict[str, Any]]:
-    resp = safe_request(url)
+async def collect_all_final_pages_async(start_url: str, brand: str, workers: int = 8,
+                                        per_host: int = 4, delay: float = 0.0,
+                                        checkpoint: Optional[CrawlCheckpoint] = None,
+                                        on_final: Optional[Callable[[str], Any]] = None) -> List[str]:
+    """
+    Concurrent version of collect_all_final_pages.
+    `workers` pages are processed at once, at most `per_host` requests go to one host
+    at the same time and requests to one host start at least `delay` seconds apart.
+    Final pages are returned in the order the sequential crawl finds them: the links of
+    every page are kept and the breadth-first walk is replayed over them at the end.
+    A crawl resumed from a checkpoint has no links for the pages visited before, so its
+    pages come back in discovery order instead. Pages being fetched when the crawl is interrupted stay in the checkpointed frontier.
+    `on_final` is called with every final page as soon as it is found (pages restored
+    from the checkpoint first); an awaitable it returns is awaited, holding that worker.
+    """
+    loop = asyncio.get_running_loop()
+    brand_pattern = f"/en/{brand.lower()}/"
+    discovered = {start_url: 0}
+    done, final_pages, links_of = set(), [], {}
+    queue = asyncio.Queue()
+
+    state = checkpoint.load() if checkpoint else None
+    if state:
+        discovered = {url: i for i, url in enumerate(state["visited"] + state["frontier"])}
+        done, final_pages = set(state["visited"]), list(state["final_pages"])
+        print(f"↻ Продолжаем обход: {len(done)} посещено, {len(state['frontier'])} в очереди")
+        for url in state["frontier"]:
+            queue.put_nowait(url)
+    else:
+        queue.put_nowait(start_url)
+
+    async def emit(url):
+        if on_final:
+            result = on_final(url)
+            if asyncio.isfuture(result) or asyncio.iscoroutine(result):
+                await result
+
+    for url in list(final_pages):
+        await emit(url)
+
+    def save_checkpoint(force=False):
+        # Списки собираются только когда чекпоинт действительно пишется, а не на каждой странице
+        if checkpoint and checkpoint.due(force):
+            checkpoint.write([u for u in discovered if u in done],
+                             [u for u in discovered if u not in done],
+                             sorted(final_pages, key=discovered.get))
+
+    host_slots, host_locks, last_start = {}, {}, {}
+
+    async def fetch(pool, url):
+        host = urlparse(url).netloc
+        if host not in host_slots:
+            host_slots[host] = asyncio.Semaphore(per_host)
+            host_locks[host] = asyncio.Lock()
+            last_start[host] = 0.0
+
+        async with host_slots[host]:
+            async with host_locks[host]:
+                pause = last_start[host] + delay - loop.time()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                last_start[host] = loop.time()
+            return await loop.run_in_executor(pool, safe_request, url)
+
+    async def worker(pool):
+        while True:
+            url = await queue.get()
+            try:
+                resp = await fetch(pool, url)
+                if not resp:
+                    done.add(url)
+                    save_checkpoint()
+                    continue
+                is_final, links = await loop.run_in_executor(pool, _parse_listing, resp.text, brand_pattern)
+                if is_final:
+                    final_pages.append(url)
+                links_of[url] = links
+                for full in links:
+                    if full not in discovered:
+                        discovered[full] = len(discovered)
+                        queue.put_nowait(full)
+                done.add(url)
+                save_checkpoint()
+                if is_final:
+                    await emit(url)
+            except Exception as e:
+                print(f"⚠️ Ошибка обработки {url}: {e}")
+            finally:
+                queue.task_done()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        tasks = [asyncio.create_task(worker(pool)) for _ in range(workers)]
+        try:
+            await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            save_checkpoint(force=True)
+
+    order = discovered if state else _bfs_order(start_url, links_of)
+    return sorted(final_pages, key=order.get)
+
+
+def _bfs_order(start_url: str, links_of: Dict[str, List[str]]) -> Dict[str, int]:
+    """Position of every page in the breadth-first walk collect_all_final_pages does."""
+    order, queue = {start_url: 0}, deque([start_url])
+    while queue:
+        for link in links_of.get(queue.popleft(), ()):
+            if link not in order:
+                order[link] = len(order)
+                queue.append(link)
+    return order
+
+
+def parse_product_page(brand, url: str, describe: bool = True) -> Optional[Dict[str, Any]]:
+    resp = _fetch(url)
     if not resp:
         return None
 
-    soup = BeautifulSoup(resp.text, "html.parser")
-    tegel = soup.select_one("div.shopTegel a.link")
-    if not tegel or "href" not in tegel.attrs:
+    href, sizes = _parse(parse_category_html, resp.text)
+    if not href:
         return None
 
-    href = tegel["href"]
-    product_url = href if href.startswith("http") else BASE_URL + href
+    product_url = absolute_url(href)
 
-    resp2 = safe_request(product_url)
-    if not resp2:
+    fields = get_product_fields(brand, product_url, describe)
+    if not fields:
         return None
+    metrics.inc("products_extracted_total")
 
-    soup2 = BeautifulSoup(resp2.text, "html.parser")
     return {
         "category_url": url,
         "product_url":  product_url,
-        "name":         extract_name(soup2),
-        "images":       extract_images(soup2),
-        "price":        extract_price(soup2),
-        "ean":          extract_ean(soup2),
-        "sizes":        extract_sizes(soup),
-        **extract_descriptions(soup2, brand)
+        "name":         fields["name"],
+        "images":       list(fields["images"]),
+        "price":        fields["price"],
+        "ean":          fields["ean"],
+        "sizes":        sizes,
+        "short-description": fields.get("short-description", ""),
+        "long-description":  fields.get("long-description", ""),
+    }
+
+
+def absolute_url(href: str) -> str:
+    return href if href.startswith("http") else BASE_URL + href
+
+
+def parse_category_html(html: str) -> Tuple[Optional[str], List[str]]:
+    """
+    Returns the first product link of a category page and the sizes listed on it.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=CATEGORY_STRAINER)
+    tegel = soup.select_one("div.shopTegel a.link")
+    if not tegel or "href" not in tegel.attrs:
+        return None, []
+    return tegel["href"], extract_sizes(soup)
+
+
+def parse_product_html(html: str) -> Dict[str, Any]:
+    """
+    Extracts name, images, price and EAN from a product page in one parse.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=PRODUCT_STRAINER)
+    return {
+        "name":   extract_name(soup),
+        "images": extract_images(soup),
+        "price":  extract_price(soup),
+        "ean":    extract_ean(soup),
     }
 
+
+def parse_price_html(html: str) -> Dict[str, str]:
+    """
+    Price and EAN of a product page, for refreshing a product already extracted.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=PRICE_STRAINER)
+    return {"price": extract_price(soup), "ean": extract_ean(soup)}
+
+
+def get_product_fields(brand, product_url: str, describe: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Fetches, parses and (unless `describe` is off) describes a product page once per
+    brand/product_url/describe. Concurrent callers for the same URL wait for the first
+    one and share its result; failures are not remembered, so a later duplicate tries again.
+    """
+    key = (brand, product_url, describe)
+    with _product_memo_lock:
+        future = _product_memo.get(key)
+        owner = future is None
+        if owner:
+            future = _product_memo[key] = Future()
+
+    if owner:
+        try:
+            fields = _load_product_fields(brand, product_url, describe)
+        except Exception as e:
+            fields = None
+            future.set_exception(e)
+        else:
+            future.set_result(fields)
+        if fields is None:
+            with _product_memo_lock:
+                _product_memo.pop(key, None)
+
+    return future.result()
+
+
+def _load_product_fields(brand, product_url: str, describe: bool) -> Optional[Dict[str, Any]]:
+    resp = _fetch(product_url)
+    if not resp:
+        return None
+
+    fields = _parse(parse_product_html, resp.text)
+    if describe:
+        fields.update(extract_descriptions(fields["name"], brand))
+    return fields
+
+
+def clear_product_memo():
+    with _product_memo_lock:
+        _product_memo.clear()
+
+
 def extract_name(soup: BeautifulSoup) -> str:
     tag = soup.select_one("div.omschrijving h1")
     name = tag.get_text(strip=True) if tag else "No name"
@@ -101,14 +399,25 @@ def extract_sizes(soup: BeautifulSoup) -> List[str]:
                 sizes.append(parts[1])
     return sorted(set(sizes))
 
-def extract_descriptions(soup, brand: str) -> Dict[str, str]:
-    name = extract_name(soup)
-    raw = generate_description(name, brand)
-
+def extract_descriptions(name: str, brand: str) -> Dict[str, str]:
+    """
+    Raises ValueError when no well-formed description could be generated, so the
+    product is left out (and extracted again on the next --resume run) instead of
+    being saved with empty descriptions.
+    """
+    raw = cached_description(name, brand)
+    if raw is None:
+        with _llm_slots:
+            raw = generate_description(name, brand, use_cache=False)
+    if not DESCRIPTION_FORMAT.search(raw):
+        raise ValueError(f"нет корректного описания для «{name}»")
+    return split_description(raw)
+
+
+def split_description(raw: str) -> Dict[str, str]:
     short, long = "", ""
 
-    # Регулярка, устойчивая к регистру и лишним пробелам
-    m = re.search(r"1\.\s*Īsais:\s*(.+?)\s*2\.\s*Garais:\s*(.+)", raw, re.S | re.I)
+    m = DESCRIPTION_FORMAT.search(raw)
     if m:
         short = m.group(1).strip()
         long = m.group(2).strip()
@@ -118,14 +427,96 @@ def extract_descriptions(soup, brand: str) -> Dict[str, str]:
     return {"short-description": short, "long-description": long}
 
 
-
-
-def get_product_details(brand, category_url: str) -> Optional[Dict[str, Any]]:
+def attach_descriptions(products: List[Optional[Dict[str, Any]]], brand,
+                        batch_size: int = 10) -> List[Dict[str, Any]]:
+    """
+    Fills short/long descriptions of products extracted with describe=False,
+    generating them in batches of `batch_size` products per LLM request.
+    Returns the products that got a well-formed description; the others are
+    left without one and should not be saved.
+    """
+    names = list(dict.fromkeys(p["name"] for p in products if p))
+    raws = generate_descriptions_batch([(name, brand) for name in names], batch_size=batch_size)
+    by_name = {name: split_description(raw) for name, raw in zip(names, raws) if DESCRIPTION_FORMAT.search(raw)}
+    described = []
+    for prod in products:
+        if prod and prod["name"] in by_name:
+            prod.update(by_name[prod["name"]])
+            described.append(prod)
+        elif prod:
+            print(f"✘ Нет корректного описания, товар пропущен: {prod['name']}")
+    return described
+
+
+def get_product_details(brand, category_url: str, describe: bool = True) -> Optional[Dict[str, Any]]:
     try:
-        data = parse_product_page(brand, category_url)
+        data = parse_product_page(brand, category_url, describe)
         if data:
             print(f"✔ Parsed: {data['name']}")
         return data
     except Exception as e:
         print(f"✘ Ошибка парсинга {category_url}: {e}")
         return None
+
+
+def get_products_parallel(brand, pages: List[str], workers: int = 8, describe: bool = True,
+                          ordered: bool = True):
+    """
+    Runs get_product_details for every page on a pool of `workers` threads.
+    Yields (index, page, result) as soon as each result is ready: in input order,
+    or in completion order with ordered=False.
+    """
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(get_product_details, brand, url, describe): (i, url)
+                       for i, url in enumerate(pages)}
+            for future in (futures if ordered else as_completed(futures)):
+                i, url = futures[future]
+                yield i, url, future.result()
+    finally:
+        clear_product_memo()
+
+
+def refresh_products(records: List[Dict[str, Any]], workers: int = 8):
+    """
+    Re-reads what can change without the product changing: sizes from each
+    record's category page and price/EAN from its product page (fetched once per
+    product_url). No descriptions are generated and no images are touched.
+    Yields (record, refreshed) in input order; refreshed is a copy of the record
+    with the new values, or None when a page could not be read or the category
+    page now links to another product.
+    """
+    def category(record):
+        resp = _fetch(record["category_url"])
+        if not resp:
+            return None
+        href, sizes = _parse(parse_category_html, resp.text)
+        if not href or absolute_url(href) != record["product_url"]:
+            print(f"✘ Страница {record['category_url']} больше не ведёт на {record['product_url']}")
+            return None
+        return sizes
+
+    def product(url):
+        resp = _fetch(url)
+        if not resp:
+            return None
+        fields = _parse(parse_price_html, resp.text)
+        return fields if fields["price"] != "Not found" else None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        prices = {url: pool.submit(product, url) for url in dict.fromkeys(r["product_url"] for r in records)}
+        pages = [pool.submit(category, record) for record in records]
+        for record, page in zip(records, pages):
+            try:
+                sizes, fields = page.result(), prices[record["product_url"]].result()
+            except Exception as e:
+                print(f"✘ Ошибка обновления {record['category_url']}: {e}")
+                sizes = fields = None
+            if sizes is None or fields is None:
+                metrics.inc("products_refreshed_total", result="failed")
+                yield record, None
+                continue
+            refreshed = dict(record, sizes=sizes, **fields)
+            changed = refreshed["price"] != record["price"] or refreshed["sizes"] != record["sizes"]
+            metrics.inc("products_refreshed_total", result="changed" if changed else "same")
+            yield record, refreshed
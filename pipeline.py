@@ -0,0 +1,315 @@
+"""
+Non-interactive crawl → extract → upload for one or more brands.
+
+The three stages run at the same time, connected by bounded queues: extraction
+starts on the first final page the crawl finds and upload on the first extracted
+product, and a full queue holds the stage feeding it. Every stage keeps the same
+on-disk state as the menu flows in main.py (crawl checkpoint, products JSONL,
+sync ledger), so an interrupted run continues with --resume and a re-run only
+uploads what changed. Brands are processed one after another.
+
+    python pipeline.py sidi furygan --resume
+    # cron, every night at 03:00; a run still in progress makes the next one exit
+    0 3 * * * cd /opt/importer && python pipeline.py --resume >> pipeline.log 2>&1   # brands from PIPELINE_BRANDS
+"""
+import os
+import sys
+import time
+import queue
+import asyncio
+import argparse
+import threading
+import traceback
+from contextlib import contextmanager
+
+from main import (
+    OUTPUT_DIR, DETAILS_DIR, CRAWL_WORKERS, CRAWL_PER_HOST, CRAWL_DELAY, EXTRACT_WORKERS,
+    EXTRACT_FETCH_LIMIT, EXTRACT_LLM_LIMIT, PARSE_PROCESSES, DESCRIPTION_BATCH_SIZE,
+    ensure_dir, save_json, print_request_stats,
+)
+from parser import (
+    BASE_URL, collect_all_final_pages_async, get_product_details, set_extraction_limits, set_parse_pool,
+    attach_descriptions, clear_product_memo,
+)
+from product_store import JsonlWriter, iter_products
+from catalog import get_catalog
+from crawl_checkpoint import CrawlCheckpoint
+from metrics import write_metrics
+from uploader import UPLOAD_BACKEND, UPLOAD_WORKERS, admin_credentials, prefetch_images, upload_stream
+
+# Items each queue between two stages holds before the producing stage waits
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))
+# Brands for runs without brand arguments (cron), comma separated
+PIPELINE_BRANDS = os.getenv("PIPELINE_BRANDS", "")
+# Longest wait for more products before a partial description batch is generated
+BATCH_WAIT = 5.0
+LOCK_PATH = os.path.join(OUTPUT_DIR, "pipeline.lock")
+
+_DONE = object()
+
+
+def _put(q, item, stop):
+    """
+    Blocking put that gives up once `stop` is set. Returns whether the item was queued.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop, timeout=None):
+    """
+    Blocking get that returns _DONE once `stop` is set; raises queue.Empty after `timeout`.
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while not stop.is_set():
+        wait = 0.5 if deadline is None else min(0.5, deadline - time.monotonic())
+        if wait <= 0:
+            raise queue.Empty
+        try:
+            return q.get(timeout=wait)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _drain(q, stop):
+    while True:
+        item = _get(q, stop)
+        if item is _DONE:
+            return
+        yield item
+
+
+@contextmanager
+def run_lock(path=LOCK_PATH):
+    """
+    Exclusive lock on `path` for the duration of a run, so overlapping cron runs
+    don't crawl and upload the same brands twice.
+    """
+    ensure_dir(os.path.dirname(path) or ".")
+    f = open(path, "a+")
+    try:
+        f.seek(0)
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        raise RuntimeError(f"Другой запуск уже идёт ({path})")
+    try:
+        yield
+    finally:
+        f.close()
+
+
+def run_brand(brand, resume=False, upload=True, queue_size=PIPELINE_QUEUE_SIZE, start_url=None):
+    """
+    Runs the three stages for one brand (slug as in the menu flows, e.g.
+    "rusty-stitches"). Returns a summary dict; raises if a stage failed.
+    """
+    slug = brand.strip().lower().replace(" ", "-")
+    brand_name = slug.replace("-", " ").upper()
+    start_url = start_url or f"{BASE_URL}/en/{slug}"
+    credentials = admin_credentials() if upload else None
+
+    ensure_dir(OUTPUT_DIR)
+    ensure_dir(DETAILS_DIR)
+    checkpoint = CrawlCheckpoint(os.path.join(OUTPUT_DIR, f"{slug}_crawl_state.json"), start_url)
+    if not resume:
+        checkpoint.remove()
+    out_path = os.path.join(DETAILS_DIR, f"{slug}_products.jsonl")
+    writer = JsonlWriter(out_path, resume=resume)
+    if not resume:
+        get_catalog().forget(slug)
+    already_extracted = set(writer.done_urls)
+
+    pages_q = queue.Queue(maxsize=queue_size)
+    products_q = queue.Queue(maxsize=queue_size)
+    upload_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    failed = []
+    summary = {"brand": slug, "pages": 0, "extracted": 0, "uploaded": None}
+
+    def crawl():
+        def emit(url):
+            # Ждём в пуле потоков, а не в цикле событий: остальные воркеры обхода продолжают работать
+            return asyncio.get_running_loop().run_in_executor(None, _put, pages_q, url, stop)
+
+        try:
+            pages = asyncio.run(collect_all_final_pages_async(
+                start_url, slug,
+                workers=CRAWL_WORKERS, per_host=CRAWL_PER_HOST, delay=CRAWL_DELAY,
+                checkpoint=checkpoint, on_final=emit,
+            ))
+            summary["pages"] = len(pages)
+            save_json(pages, os.path.join(OUTPUT_DIR, f"{slug}_final_pages.json"))
+            checkpoint.remove()
+        finally:
+            _put(pages_q, _DONE, stop)
+
+    def extract():
+        def worker():
+            try:
+                while True:
+                    url = _get(pages_q, stop)
+                    if url is _DONE:
+                        _put(pages_q, _DONE, stop)
+                        return
+                    if url in already_extracted:
+                        continue
+                    product = get_product_details(slug, url, describe=DESCRIPTION_BATCH_SIZE <= 1)
+                    if product and not _put(products_q, product, stop):
+                        return
+            except Exception:
+                # Иначе поток молча умирает: товары теряются, а без потоков обход виснет на полной очереди
+                traceback.print_exc()
+                if "extract" not in failed:
+                    failed.append("extract")
+                stop.set()
+
+        threads = [threading.Thread(target=worker, name=f"{slug}-extract-{n}") for n in range(EXTRACT_WORKERS)]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            _put(products_q, _DONE, stop)
+
+    def write():
+        first = {}
+        pending = []
+
+        def forward(product):
+            # Тот же товар с другой страницы категории: отправляем первую запись с объединёнными размерами
+            known = first.get(product["product_url"])
+            if known:
+                if set(product["sizes"]) <= set(known["sizes"]):
+                    return
+                sizes = sorted(set(known["sizes"]) | set(product["sizes"]))
+                product = first[product["product_url"]] = dict(known, sizes=sizes)
+            else:
+                first[product["product_url"]] = product
+            if upload:
+                prefetch_images(product)
+                _put(upload_q, product, stop)
+
+        def flush():
+            if DESCRIPTION_BATCH_SIZE > 1 and pending:
+                pending[:] = attach_descriptions(pending, slug, batch_size=DESCRIPTION_BATCH_SIZE)
+            for product in pending:
+                writer.write(product)
+            get_catalog().put_many(pending, slug)
+            for product in pending:
+                forward(product)
+            summary["extracted"] += len(pending)
+            pending.clear()
+
+        try:
+            # Товары, извлечённые в прерванном запуске, тоже проходят через загрузку (журнал пропустит готовые)
+            if resume:
+                for product in iter_products(out_path):
+                    forward(product)
+            while True:
+                try:
+                    product = _get(products_q, stop, timeout=BATCH_WAIT if pending else None)
+                except queue.Empty:
+                    flush()
+                    continue
+                if product is _DONE:
+                    break
+                pending.append(product)
+                if len(pending) >= DESCRIPTION_BATCH_SIZE:
+                    flush()
+            flush()
+        finally:
+            writer.close()
+            _put(upload_q, _DONE, stop)
+
+    def upload_stage():
+        counts = upload_stream(_drain(upload_q, stop), brand_name, *credentials,
+                               backend=UPLOAD_BACKEND, workers=UPLOAD_WORKERS)
+        summary["uploaded"] = counts
+
+    def stage(name, func):
+        def run():
+            try:
+                func()
+            except Exception:
+                traceback.print_exc()
+                failed.append(name)
+                stop.set()
+        return threading.Thread(target=run, name=f"{slug}-{name}")
+
+    stages = [stage("crawl", crawl), stage("extract", extract), stage("write", write)]
+    if upload:
+        stages.append(stage("upload", upload_stage))
+
+    print(f"\n🚀 {brand_name}: {start_url}")
+    t0 = time.time()
+    set_extraction_limits(fetch=EXTRACT_FETCH_LIMIT, llm=EXTRACT_LLM_LIMIT)
+    set_parse_pool(PARSE_PROCESSES)
+    try:
+        for t in stages:
+            t.start()
+        for t in stages:
+            t.join()
+    finally:
+        set_parse_pool(0)
+        clear_product_memo()
+
+    summary["seconds"] = round(time.time() - t0, 1)
+    if failed:
+        raise RuntimeError(f"{brand_name}: ошибка на этапах {', '.join(failed)}")
+    return summary
+
+
+def run_pipeline(brands, resume=False, upload=True):
+    """
+    Runs every brand in turn; a failed brand doesn't stop the others.
+    Returns the brands that failed.
+    """
+    failed = []
+    with run_lock():
+        for brand in brands:
+            try:
+                summary = run_brand(brand, resume=resume, upload=upload)
+                print(f"✅ {summary}")
+            except Exception as e:
+                print(f"❌ {e}")
+                failed.append(brand)
+        print_request_stats()
+        write_metrics("pipeline")
+    return failed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="jopa.nl → motobuzz.lv: обход, извлечение и загрузка без вопросов")
+    arg_parser.add_argument("brands", nargs="*", help="бренды (по умолчанию из PIPELINE_BRANDS)")
+    arg_parser.add_argument("--resume", action="store_true",
+                            help="продолжить прерванный обход/извлечение с того места, где остановились")
+    arg_parser.add_argument("--no-upload", action="store_true", help="только обход и извлечение")
+    args = arg_parser.parse_args()
+
+    brands = args.brands or [b.strip() for b in PIPELINE_BRANDS.split(",") if b.strip()]
+    if not brands:
+        arg_parser.error("укажите бренды или PIPELINE_BRANDS")
+
+    try:
+        failed = run_pipeline(brands, resume=args.resume, upload=not args.no_upload)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
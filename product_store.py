@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class JsonlWriter:
+    """
+    Appends product records to a JSONL file, one line per product, flushed and
+    fsynced as soon as they are written, so a crash loses at most the record
+    being written. With resume=True existing records are kept (a torn last line
+    is cut off) and their category URLs are available through `done_urls`.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.done_urls = set()
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume and os.path.exists(path):
+            _drop_torn_tail(path)
+            self.done_urls = {p.get("category_url") for p in iter_products(path)}
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.done_urls.add(record.get("category_url"))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _drop_torn_tail(path: str):
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+
+
+def iter_products(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streams product records from a .jsonl file line by line. Legacy .json files
+    (one JSON array) are still accepted; empty entries are skipped.
+    """
+    if not path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for prod in json.load(f):
+                if prod:
+                    yield prod
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Torn last line after a crash
+                continue
+
+
+def merge_duplicate_products(products: List[Optional[Dict[str, Any]]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Collapses entries pointing to the same product_url into the first one,
+    with the union of their sizes.
+    """
+    merged, by_url = [], {}
+    for prod in products:
+        if not prod:
+            merged.append(prod)
+            continue
+        first = by_url.get(prod["product_url"])
+        if first is None:
+            by_url[prod["product_url"]] = prod
+            merged.append(prod)
+        else:
+            first["sizes"] = sorted(set(first["sizes"]) | set(prod["sizes"]))
+    return merged
@@ -0,0 +1,54 @@
+"""
+Price/stock refresh of products already extracted and uploaded: re-reads only
+price, EAN and sizes (no descriptions, no images) and pushes changed prices and
+new sizes to the site. Used by the menu (main.py) and `python catalog.py refresh`.
+"""
+import time
+
+from catalog import get_catalog
+from parser import refresh_products
+from uploader import UPLOAD_BACKEND, UPLOAD_WORKERS, admin_credentials, upload_stream
+
+# sync_ledger.SYNC_FIELDS/ADDITIVE_FIELDS a refresh may update on the site
+REFRESH_FIELDS = ("price", "sizes")
+
+
+def refresh_brand(brand, upload=True, workers=8):
+    """
+    Re-reads price, EAN and sizes of the brand's catalog records on `workers`
+    threads, saves them to the catalog and, with `upload`, updates the price
+    and variants of products already on the site whose values differ from the
+    sync ledger. New sizes are added; sizes gone from the supplier are only
+    reported, since variants are never removed from the site. Returns the upload counts, {} without `upload`, or None when
+    the catalog has no records of the brand.
+    """
+    catalog = get_catalog()
+    records = catalog.products(brand)
+    if not records:
+        print(f"❌ В каталоге нет товаров бренда {brand}")
+        return None
+
+    print(f"💶 Обновляем цены и размеры {len(records)} записей...")
+    t0 = time.time()
+    refreshed, changed, failed = [], 0, 0
+    for old, new in refresh_products(records, workers=workers):
+        if new is None:
+            failed += 1
+            continue
+        if (new["price"], new["sizes"]) != (old["price"], old["sizes"]):
+            changed += 1
+            print(f"  {new['name']}: {old['price']} → {new['price']}, размеры {', '.join(new['sizes']) or '-'}")
+        gone = [size for size in old["sizes"] if size not in new["sizes"]]
+        if gone:
+            # Варианты на сайте только добавляются: распроданные размеры снимаются вручную
+            print(f"⚠️ {new['name']}: у поставщика больше нет размеров {', '.join(gone)} — снимите их в товаре вручную")
+        refreshed.append(new)
+    catalog.put_many(refreshed, brand)
+    print(f"📄 Обновлено {len(refreshed)} записей за {time.time() - t0:.2f} сек., изменилось {changed}"
+          + (f", не удалось прочитать {failed}" if failed else ""))
+
+    if not upload:
+        return {}
+    # Сравниваем с журналом загрузок, а не с каталогом: изменения, не дошедшие до сайта в прошлый раз, тоже уйдут
+    return upload_stream(catalog.products(brand, merged=True), brand.replace("-", " ").upper(), *admin_credentials(),
+                         backend=UPLOAD_BACKEND, workers=UPLOAD_WORKERS, fields=REFRESH_FIELDS)
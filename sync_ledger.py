@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+LEDGER_PATH = os.getenv("SYNC_LEDGER_PATH", os.path.join("product_details", "sync_ledger.sqlite3"))
+
+# Product fields an already uploaded product can be updated in, and the record keys they come from
+SYNC_FIELDS = {
+    "price": ("price",),
+    "descriptions": ("short-description", "long-description"),
+}
+# Lists whose new items are added to the product; nothing is ever removed from it
+ADDITIVE_FIELDS = ("images", "sizes")
+
+
+def _digest(value: Any) -> str:
+    payload = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def content_hash(prod: Dict[str, Any]) -> str:
+    return _digest(prod)
+
+
+def field_hashes(prod: Dict[str, Any]) -> Dict[str, str]:
+    return {field: _digest([prod.get(key) for key in keys]) for field, keys in SYNC_FIELDS.items()}
+
+
+def added_items(entry: Dict[str, Any], prod: Dict[str, Any], key: str) -> List[str]:
+    """
+    Images or sizes of `prod` that the ledger entry says are not on the product yet.
+    """
+    before = entry.get(key) or []
+    return [x for x in prod.get(key) or [] if x not in before]
+
+
+class SyncLedger:
+    """
+    What has been uploaded to the admin: original_url → external_id/product_pk,
+    plus hashes of the record and of each SYNC_FIELDS group as uploaded, and every
+    image URL and size put on the product. A product listed on several category
+    pages arrives as several partial records; keeping the union of images and
+    sizes means none of them looks like a change.
+    """
+
+    def __init__(self, path: str = LEDGER_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS products (
+                original_url TEXT PRIMARY KEY,
+                brand        TEXT NOT NULL,
+                external_id  TEXT NOT NULL,
+                product_pk   TEXT,
+                product_url  TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                field_hashes TEXT NOT NULL,
+                images       TEXT NOT NULL,
+                sizes        TEXT NOT NULL,
+                created_at   REAL NOT NULL,
+                updated_at   REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS products_brand ON products(brand)")
+        self._db.commit()
+
+    def get(self, original_url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT original_url, brand, external_id, product_pk, product_url, content_hash, "
+                "field_hashes, images, sizes FROM products WHERE original_url = ?",
+                (original_url,),
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "original_url": row[0],
+            "brand": row[1],
+            "external_id": row[2],
+            "product_pk": row[3],
+            "product_url": row[4],
+            "content_hash": row[5],
+            "field_hashes": json.loads(row[6]),
+            "images": json.loads(row[7]),
+            "sizes": json.loads(row[8]),
+        }
+
+    def diff(self, prod: Dict[str, Any]) -> Tuple[str, List[str], Optional[Dict[str, Any]]]:
+        """
+        ("create", [], None) for a product not uploaded yet, ("skip", [], entry) when
+        nothing it can be updated in has changed, otherwise ("update", fields, entry).
+        A product recorded with complete=False gets "setup" plus every field.
+        """
+        entry = self.get(prod["product_url"])
+        if not entry:
+            return "create", [], None
+        if not entry["field_hashes"]:
+            return "update", ["setup", *SYNC_FIELDS, *ADDITIVE_FIELDS], entry
+        if entry["content_hash"] == content_hash(prod):
+            return "skip", [], entry
+        current = field_hashes(prod)
+        changed = [f for f in SYNC_FIELDS if entry["field_hashes"].get(f) != current[f]]
+        changed += [key for key in ADDITIVE_FIELDS if added_items(entry, prod, key)]
+        return ("update" if changed else "skip"), changed, entry
+
+    def record(self, created: Dict[str, Any], prod: Dict[str, Any], brand: str, complete: bool = True):
+        """
+        Stores the product as uploaded. complete=False (the product exists but was
+        not fully filled) keeps no hashes, so the next run updates every field.
+        """
+        now = time.time()
+        with self._lock:
+            old = self._db.execute(
+                "SELECT created_at, images, sizes FROM products WHERE original_url = ?", (prod["product_url"],)
+            ).fetchone()
+            lists = {}
+            for i, key in enumerate(ADDITIVE_FIELDS, 1):
+                before = json.loads(old[i]) if old and complete else []
+                lists[key] = before + [x for x in prod.get(key) or [] if x not in before] if complete else []
+            self._db.execute(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    prod["product_url"],
+                    brand,
+                    created["external_id"],
+                    created.get("product_pk"),
+                    created["product_url"],
+                    content_hash(prod) if complete else "",
+                    json.dumps(field_hashes(prod) if complete else {}),
+                    json.dumps(lists["images"]),
+                    json.dumps(lists["sizes"]),
+                    old[0] if old else now,
+                    now,
+                ),
+            )
+            self._db.commit()
+
+    def forget(self, original_url: Optional[str] = None, brand: Optional[str] = None) -> int:
+        """
+        Drops entries (e.g. products deleted in the admin) so they are created again.
+        """
+        where, params = [], []
+        if original_url:
+            where.append("original_url = ?")
+            params.append(original_url)
+        if brand:
+            where.append("LOWER(brand) = LOWER(?)")
+            params.append(brand)
+        sql = "DELETE FROM products" + (" WHERE " + " AND ".join(where) if where else "")
+        with self._lock:
+            removed = self._db.execute(sql, params).rowcount
+            self._db.commit()
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT brand, COUNT(*) FROM products GROUP BY brand ORDER BY brand").fetchall()
+        return dict(rows)
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> SyncLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = SyncLedger()
+        return _ledger
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Журнал загруженных на motobuzz.lv товаров")
+    sub = arg_parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="сколько товаров каждого бренда загружено")
+    forget = sub.add_parser("forget", help="забыть товары, чтобы создать их заново")
+    forget.add_argument("--url", help="исходный URL товара")
+    forget.add_argument("--brand", help="все товары бренда")
+    forget.add_argument("--all", action="store_true", help="очистить весь журнал")
+    args = arg_parser.parse_args()
+
+    ledger = SyncLedger()
+    if args.command == "stats":
+        for brand, count in ledger.stats().items():
+            print(f"📦 {brand}: {count}")
+    elif args.command == "forget":
+        if not (args.url or args.brand or args.all):
+            arg_parser.error("укажите --url, --brand или --all")
+        removed = ledger.forget(original_url=args.url, brand=args.brand)
+        print(f"🗑 Удалено {removed} записей")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+The strained single-pass extractors must return exactly what the old full
+html.parser extraction did, including on elements with several classes.
+"""
+import os
+
+os.environ.setdefault("OPENROUTER_API_KEY_TEST", "test")
+
+from bs4 import BeautifulSoup
+
+import parser
+
+CATEGORY_HTML = """
+<html><body>
+<div class="header"><a class="link" href="/en/sidi/other">menu</a></div>
+<div class="shopTegel col-6 active"><a class="link" href="/en/sidi/boots/rex-black">Rex</a>
+  <span class="nummer small">123-41</span></div>
+<div class="shopTegel"><a class="link" href="/en/sidi/boots/rex-black">Rex</a>
+  <span class="nummer">123-42</span></div>
+<div class="shopTegel col-6"><a class="link" href="/en/sidi/boots/rex-black">Rex</a>
+  <span class="nummer text-muted">123-43</span></div>
+</body></html>
+"""
+
+PRODUCT_HTML = """
+<html><body>
+<h1>Site title</h1>
+<div class="sidebar"><span class="prijs">1,00</span></div>
+<div class="omschrijving product-info"><h1>Sidi Rex Black 42</h1></div>
+<div class="carousel-cell-groot is-selected"><img src="/img/rex-1.jpg"></div>
+<div class="carousel-cell-groot"><img src="/img/rex-2.jpg"></div>
+<div class="carousel-cell-groot extra"><img></div>
+<span class="displayprijs price">10,00<small>EUR</small></span>
+<div class="EANnummer small"><span>EAN</span><span>8017732000000</span></div>
+</body></html>
+"""
+
+
+def old_category(html):
+    soup = BeautifulSoup(html, "html.parser")
+    tegel = soup.select_one("div.shopTegel a.link")
+    if not tegel or "href" not in tegel.attrs:
+        return None, []
+    return tegel["href"], parser.extract_sizes(soup)
+
+
+def old_product(html):
+    soup = BeautifulSoup(html, "html.parser")
+    return {
+        "name":   parser.extract_name(soup),
+        "images": parser.extract_images(soup),
+        "price":  parser.extract_price(soup),
+        "ean":    parser.extract_ean(soup),
+    }
+
+
+def test_category_matches_full_parse_on_multi_class_tiles():
+    assert parser.parse_category_html(CATEGORY_HTML) == old_category(CATEGORY_HTML)
+    assert parser.parse_category_html(CATEGORY_HTML) == ("/en/sidi/boots/rex-black", ["41", "42", "43"])
+
+
+def test_product_matches_full_parse_on_multi_class_blocks():
+    fields = parser.parse_product_html(PRODUCT_HTML)
+    assert fields == old_product(PRODUCT_HTML)
+    assert fields["name"] == "Sidi Rex Black"
+    assert fields["price"] == "10,00"
+
+
+def test_price_refresh_matches_full_parse():
+    old = old_product(PRODUCT_HTML)
+    assert parser.parse_price_html(PRODUCT_HTML) == {"price": old["price"], "ean": old["ean"]}
@@ -1,29 +1,297 @@
-import json
 import os
+import json
 import time
-import tempfile
+import threading
 import traceback
 import requests
 from dotenv import load_dotenv
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import SessionNotCreatedException, TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 
+import metrics
+from catalog import get_catalog, subcategory_of
+from image_pipeline import get_pipeline
+from product_store import iter_products, merge_duplicate_products
+from sync_ledger import added_items, content_hash, get_ledger
+from admin_client import (AdminClient, AdminClientError, StepTimer, ADMIN_URL, CATEGORY_PATH, PODOBNE_LINKED_SELECTOR,
+                          PODOBNE_TABLE_SELECTOR, PRICE_FIELD, PRICE_INPUT_ID, build_field_plan, build_update_plan,
+                          extract_external_id, podobne_query, row_code, text_to_html)
+
+CATEGORY_URL = ADMIN_URL + CATEGORY_PATH
+
+# "selenium" drives Chrome, "http" posts the admin forms directly (browser as fallback)
+UPLOAD_BACKEND = os.getenv("UPLOAD_BACKEND", "selenium")
+# Number of parallel headless browsers creating products
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "1"))
+
+# "full" (default): a visible Chrome that loads everything; "fast" (opt-in): headless
+# Chrome with eager page loads, images/fonts/media/trackers blocked and the login kept
+# between runs
+BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "full")
+DRIVER_PATH_CACHE = os.path.join(".cache", "chromedriver_path")
+COOKIES_PATH = os.getenv("ADMIN_COOKIES_PATH", os.path.join(".cache", "admin_cookies.json"))
+FAST_CHROME_ARGS = [
+    "--disable-extensions", "--disable-gpu", "--no-first-run", "--no-default-browser-check",
+    "--disable-background-networking", "--disable-sync", "--mute-audio",
+]
+# Stylesheets stay: the uploader relies on CSS visibility of modals, tabs and x-editable forms
+BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.mp4", "*.webm",
+    "*google-analytics.com*", "*googletagmanager.com*", "*facebook.net*", "*hotjar.com*",
+]
+
+# Reads, for every step of the field plan, the endpoint and form data the widget
+# would post (same markup AdminClient reads), without touching the widgets.
+PREPARE_FIELDS_JS = """
+var steps = arguments[0], done = arguments[arguments.length - 1];
+function abs(url) { return new URL(url || location.href, location.href).href; }
+function formRequest(form, data) {
+    var entries = [];
+    data.forEach(function (v, k) { if (typeof v === 'string') entries.push([k, v]); });
+    return {url: abs(form.getAttribute('action')), multipart: form.enctype === 'multipart/form-data', entries: entries,
+            form: true};
+}
+function prepare(step) {
+    var value = step.value === null ? '' : String(step.value);
+    if (step.kind === 'inline') {
+        var a = document.querySelector("a.inlineedit[data-name='" + step.name + "']");
+        if (!a || !a.getAttribute('data-url')) throw new Error('Поле ' + step.name + ' не найдено');
+        var req = {url: abs(a.getAttribute('data-url')), multipart: false,
+                   entries: [['name', step.name], ['pk', a.getAttribute('data-pk') || ''], ['value', value]]};
+        if (step.label === null) return req;
+        var source = (a.getAttribute('data-source') || '').trim();
+        if (!source) throw new Error('У ' + step.name + ' нет data-source');
+        var options = '[{'.indexOf(source[0]) >= 0 ? Promise.resolve(JSON.parse(source))
+            : fetch(abs(source), {credentials: 'same-origin'}).then(function (r) { return r.json(); });
+        return options.then(function (opts) {
+            if (!Array.isArray(opts)) {
+                opts = Object.keys(opts).map(function (k) { return {value: k, text: opts[k]}; });
+            }
+            var hit = opts.filter(function (o) { return String(o.text).trim() === step.label; })[0];
+            if (!hit) throw new Error("'" + step.label + "' нет среди вариантов " + step.name);
+            req.entries[2][1] = String(hit.value);
+            return req;
+        });
+    }
+    if (step.kind === 'description') {
+        var header = document.querySelector("h4[data-for^='" + step.name + "']");
+        var target = header && header.getAttribute('data-for');
+        var area = target && (document.getElementById(target) || document.querySelector("textarea[name='" + target + "']"));
+        var form = area && area.closest('form');
+        if (!form) throw new Error('Редактор ' + step.name + ' не найден');
+        // Both texts may live in one form: later snapshots must include earlier ones
+        area.value = value;
+        return formRequest(form, new FormData(form));
+    }
+    if (step.kind === 'price') {
+        var inline = document.querySelector("a.inlineedit[data-name='" + step.name + "']");
+        if (inline && inline.getAttribute('data-url')) {
+            return {url: abs(inline.getAttribute('data-url')), multipart: false,
+                    entries: [['name', step.name], ['pk', inline.getAttribute('data-pk') || ''], ['value', value]]};
+        }
+        var input = document.getElementById(step.input);
+        if (!input || !input.closest('form')) throw new Error('Поле цены не найдено');
+        var priceData = new FormData(input.closest('form'));
+        priceData.set(input.name, value);
+        return formRequest(input.closest('form'), priceData);
+    }
+    if (step.kind === 'availability') {
+        var select = document.getElementById('dostupnost');
+        var button = document.querySelector('a.nastavit');
+        if (select && select.closest('form')) {
+            var data = new FormData(select.closest('form'));
+            data.set(select.name, value);
+            return formRequest(select.closest('form'), data);
+        }
+        if (button && button.getAttribute('data-url')) {
+            return {url: abs(button.getAttribute('data-url')), multipart: false, entries: [['dostupnost', value]]};
+        }
+        throw new Error('Настройка наличия не найдена');
+    }
+    throw new Error('Неизвестный шаг ' + step.kind);
+}
+Promise.all(steps.map(function (step) {
+    return Promise.resolve().then(function () { return prepare(step); })
+        .then(function (req) { return {request: req}; }, function (e) { return {error: String(e.message || e)}; });
+})).then(done);
+"""
+
+# Posts prepared saves concurrently with the page's own session; returns per-request time and error.
+# Form snapshots posted to the same action go one after another, in plan order, so an older
+# snapshot can't be applied after (and overwrite) a newer one of the same form.
+APPLY_FIELDS_JS = """
+var requests = arguments[0], done = arguments[arguments.length - 1];
+var chains = {};
+function post(req) {
+    var start = performance.now(), body;
+    if (req.multipart) {
+        body = new FormData();
+        req.entries.forEach(function (e) { body.append(e[0], e[1]); });
+    } else {
+        body = new URLSearchParams(req.entries);
+    }
+    return fetch(req.url, {method: 'POST', body: body, credentials: 'same-origin',
+                           headers: {'X-Requested-With': 'XMLHttpRequest'}})
+        .then(function (r) { return r.ok ? null : 'HTTP ' + r.status; }, function (e) { return String(e); })
+        .then(function (error) { return {ms: performance.now() - start, error: error}; });
+}
+Promise.all(requests.map(function (req) {
+    if (!req.form) return post(req);
+    var result = (chains[req.url] || Promise.resolve()).then(function () { return post(req); });
+    chains[req.url] = result;
+    return result;
+})).then(done);
+"""
+
+
+# Counts XHR/fetch requests in flight; added to every document before the admin's own
+# scripts (CDP), or injected on demand into a page loaded without it
+NETWORK_TRACKER_JS = """
+(function () {
+    if (window.__importerNet) return;
+    var net = window.__importerNet = {pending: 0, last: Date.now()};
+    function start() { net.pending++; net.last = Date.now(); }
+    function end() { net.pending = Math.max(0, net.pending - 1); net.last = Date.now(); }
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        start();
+        this.addEventListener('loadend', end);
+        try { return send.apply(this, arguments); } catch (e) { end(); throw e; }
+    };
+    if (window.fetch) {
+        var fetch_ = window.fetch;
+        window.fetch = function () {
+            start();
+            try { return fetch_.apply(this, arguments).finally(end); } catch (e) { end(); throw e; }
+        };
+    }
+})();
+"""
+NETWORK_STATE_JS = """
+var net = window.__importerNet;
+return net ? [net.pending, Date.now() - net.last, document.readyState] : null;
+"""
+
+
+class AdaptiveTimeouts:
+    """
+    Timeout per kind of wait that follows how long the admin actually takes:
+    `factor` times the slowest of the recent waits, kept within floor..ceiling.
+    """
+
+    def __init__(self, initial=15.0, floor=3.0, ceiling=60.0, factor=4.0, window=50):
+        self.initial = initial
+        self.floor = floor
+        self.ceiling = ceiling
+        self.factor = factor
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+
+    def timeout(self, kind):
+        with self._lock:
+            samples = self._samples[kind]
+            if not samples:
+                return self.initial
+            return min(self.ceiling, max(self.floor, self.factor * max(samples)))
+
+    def observe(self, kind, seconds):
+        with self._lock:
+            self._samples[kind].append(seconds)
+
+
+_timeouts = AdaptiveTimeouts()
+
+
+def wait_for_requests(driver, kind, quiet=0.2):
+    """
+    Waits until the page has no XHR/fetch in flight and none started or finished
+    for `quiet` seconds, i.e. the admin has saved what the last action sent. On
+    timeout it warns and returns; the longer wait raises that kind's next timeout.
+    """
+    timeout = _timeouts.timeout(kind)
+    start = time.perf_counter()
+
+    def idle(d):
+        state = d.execute_script(NETWORK_STATE_JS)
+        if state is None:
+            d.execute_script(NETWORK_TRACKER_JS)
+            return False
+        pending, since_ms, ready = state
+        watched = time.perf_counter() - start
+        return pending == 0 and ready != "loading" and min(since_ms / 1000, watched) >= quiet
 
-def load_products(json_path):
-    with open(json_path, encoding='utf-8') as f:
-        return json.load(f)
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.05).until(idle)
+    except TimeoutException:
+        print(f"⚠️ {kind}: запросы не завершились за {timeout:.0f} сек.")
+    seconds = time.perf_counter() - start
+    _timeouts.observe(kind, seconds)
+    metrics.observe("browser_wait_seconds", seconds, kind=kind)
 
 
-def init_driver():
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service)
+def load_products(json_path):
+    return merge_duplicate_products(list(iter_products(json_path)))
+
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def driver_path(refresh=False):
+    """
+    chromedriver binary: CHROMEDRIVER_PATH if set, else the one webdriver-manager
+    resolved on an earlier run (remembered in .cache), else a fresh lookup.
+    """
+    global _driver_path
+    with _driver_path_lock:
+        if os.getenv("CHROMEDRIVER_PATH"):
+            return os.getenv("CHROMEDRIVER_PATH")
+        if not refresh:
+            if _driver_path:
+                return _driver_path
+            try:
+                with open(DRIVER_PATH_CACHE, encoding="utf-8") as f:
+                    path = f.read().strip()
+                if os.path.exists(path):
+                    _driver_path = path
+                    return path
+            except OSError:
+                pass
+        _driver_path = ChromeDriverManager().install()
+        os.makedirs(os.path.dirname(DRIVER_PATH_CACHE), exist_ok=True)
+        with open(DRIVER_PATH_CACHE, "w", encoding="utf-8") as f:
+            f.write(_driver_path)
+        return _driver_path
+
+
+def init_driver(headless=False, fast=False):
+    options = Options()
+    if headless or fast:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1600,1200")
+    if fast:
+        options.page_load_strategy = "eager"
+        for arg in FAST_CHROME_ARGS:
+            options.add_argument(arg)
+    try:
+        driver = webdriver.Chrome(service=Service(driver_path()), options=options)
+    except SessionNotCreatedException:
+        # Chrome обновился, а запомненный драйвер остался от старой версии
+        driver = webdriver.Chrome(service=Service(driver_path(refresh=True)), options=options)
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": NETWORK_TRACKER_JS})
+    if fast:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
     wait = WebDriverWait(driver, 15)
     return driver, wait
 
@@ -36,6 +304,44 @@ def login(driver, wait, url, username, password):
     wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, '.sidebar')))
 
 
+def save_session(driver, path=COOKIES_PATH):
+    """
+    Stores the logged-in browser's cookies so the next run can skip the login form.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Каждый поток пишет свой временный файл: при нескольких воркерах браузеры сохраняют сессию одновременно
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+        json.dump(driver.get_cookies(), f)
+    os.replace(tmp, path)
+
+
+def restore_session(driver, wait, url, path=COOKIES_PATH):
+    """
+    Puts cookies saved by save_session into the browser and opens `url`.
+    Returns whether the admin accepted them (the sidebar shows instead of the login form).
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            cookies = json.load(f)
+    except (OSError, ValueError):
+        return False
+    for cookie in cookies:
+        params = {k: cookie[k] for k in ("name", "value", "domain", "path", "secure", "httpOnly") if k in cookie}
+        if "expiry" in cookie:
+            params["expires"] = cookie["expiry"]
+        if cookie.get("sameSite") in ("Strict", "Lax", "None"):
+            params["sameSite"] = cookie["sameSite"]
+        # Через CDP куки ставятся до первой загрузки страницы домена
+        driver.execute_cdp_cmd("Network.setCookie", params)
+    driver.get(url)
+    wait.until(EC.any_of(
+        EC.presence_of_element_located((By.CSS_SELECTOR, '.sidebar')),
+        EC.presence_of_element_located((By.NAME, '_username')),
+    ))
+    return bool(driver.find_elements(By.CSS_SELECTOR, '.sidebar'))
+
+
 def inline_edit_text(driver, wait, data_name, value):
     anchor = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, f"a.inlineedit[data-name='{data_name}']")))
     anchor.click()
@@ -56,6 +362,22 @@ def inline_edit_text(driver, wait, data_name, value):
     wait.until(EC.staleness_of(form))
 
 
+def set_price(driver, wait, value):
+    """
+    Saves the price through the PRICE_FIELD inline editor, or through the form
+    holding input#cena when the page has no such editor (see admin_client.PRICE_FIELD).
+    """
+    if driver.find_elements(By.CSS_SELECTOR, f"a.inlineedit[data-name='{PRICE_FIELD}']"):
+        inline_edit_text(driver, wait, PRICE_FIELD, value)
+        return
+    price_input = wait.until(EC.visibility_of_element_located((By.ID, PRICE_INPUT_ID)))
+    price_input.clear()
+    price_input.send_keys(value)
+    price_input.find_element(By.XPATH, "./ancestor::form[1]").submit()
+    wait.until(EC.staleness_of(price_input))
+    wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, '.sidebar')))
+
+
 def inline_edit_brand_js(driver, wait, data_name, brand_name):
     anchor = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, f"a.inlineedit[data-name='{data_name}']")))
     anchor.click()
@@ -86,10 +408,14 @@ def inline_edit_brand_js(driver, wait, data_name, brand_name):
 
 def fill_tinymce(driver, wait, data_name, text):
     try:
+        # Редактор, открытый раньше на этой же странице, остаётся в DOM: берём только что созданный
+        editors = len(driver.find_elements(By.CSS_SELECTOR, "iframe[id^='mce_']"))
         header = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, f"h4[data-for^='{data_name}']")))
         header.click()
 
-        iframe = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "iframe[id^='mce_']")))
+        iframe = wait.until(lambda d: (d.find_elements(By.CSS_SELECTOR, "iframe[id^='mce_']")[editors:] or [None])[-1])
+        containers = iframe.find_elements(By.XPATH, "./ancestor::div[contains(@class, 'tox-tinymce')]")
+        scope = containers[-1] if containers else driver
         driver.switch_to.frame(iframe)
 
         body = wait.until(EC.presence_of_element_located((By.ID, 'tinymce')))
@@ -98,12 +424,11 @@ def fill_tinymce(driver, wait, data_name, text):
         body.send_keys(text)
 
         driver.switch_to.default_content()
-        save_btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button[data-mce-name='save']")))
+        save_btn = wait.until(lambda d: scope.find_element(By.CSS_SELECTOR, "button[data-mce-name='save']"))
         save_btn.click()
-        wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button[data-mce-name='savedone']")))
-
-        driver.refresh()
-        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, '.sidebar')))
+        wait.until(lambda d: EC.element_to_be_clickable(
+            scope.find_element(By.CSS_SELECTOR, "button[data-mce-name='savedone']"))(d))
+        wait_for_requests(driver, "description")
 
     except Exception as e:
         print(f"Ошибка при заполнении TinyMCE для {data_name}: {e}")
@@ -111,28 +436,22 @@ def fill_tinymce(driver, wait, data_name, text):
 
 def upload_images(driver, wait, image_urls):
     try:
+        # Обычно уже скачаны заранее через get_pipeline().prefetch в start_upload
+        paths = [os.path.abspath(p) for p in get_pipeline().paths(image_urls)]
+        if not paths:
+            print("⚠️ Нет изображений для загрузки")
+            return
+
         tab = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "a[data-presenter='img_galerie']")))
         tab.click()
         gallery = wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, "div.galerie_container")))
         file_input = gallery.find_element(By.CSS_SELECTOR, "input[name='upload[]']")
         driver.execute_script("arguments[0].classList.remove('hidden')", file_input)
 
-        temp_dir = tempfile.mkdtemp()
-        paths = []
-        for idx, url in enumerate(image_urls):
-            resp = requests.get(url, timeout=15)
-            local = os.path.join(temp_dir, f"img_{idx}.jpg")
-            with open(local, 'wb') as f:
-                f.write(resp.content)
-            paths.append(local)
-
         file_input.send_keys("\n".join(paths))
+        wait_for_requests(driver, "images")
         wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, "div.galerie_upload .galerie_telo")))
 
-        for p in paths:
-            os.remove(p)
-        os.rmdir(temp_dir)
-
         print("✔ Изображения успешно загружены")
 
     except Exception as e:
@@ -169,8 +488,7 @@ def upload_variants(driver, wait, variants):
         traceback.print_exc()
 
 def set_price_source_to_product(driver, wait):
-    driver.get(driver.current_url)
-
+    wait_for_requests(driver, "price-source")
     wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, ".sidebar")))
 
     driver.find_element(By.CSS_SELECTOR, "a[data-presenter='zbozi_detail']").click()
@@ -192,8 +510,7 @@ def set_price_source_to_product(driver, wait):
     driver.execute_script("arguments[0].click();", submit_btn)
 
     wait.until(EC.staleness_of(form))
-
-    driver.refresh()
+    wait_for_requests(driver, "price-source")
 
 def set_accessability(driver, wait):
     btn = wait.until(EC.element_to_be_clickable((
@@ -205,31 +522,85 @@ def set_accessability(driver, wait):
     select_elem = wait.until(EC.element_to_be_clickable((By.ID, "dostupnost")))
     select = Select(select_elem)
     select.select_by_value("1") 
-
-    time.sleep(0.5)
+    wait_for_requests(driver, "availability")
 
     nastavit_btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "a.nastavit.btn.btn-xs.btn-success")))
     nastavit_btn.click()
+    wait_for_requests(driver, "availability")
+
+
+def apply_step_ui(driver, wait, step):
+    """
+    Saves one field-plan step through the editors themselves (the old, slow way).
+    """
+    if step.kind == "description":
+        fill_tinymce(driver, wait, step.name, step.value)
+    elif step.kind == "price":
+        set_price(driver, wait, step.value)
+    elif step.kind == "availability":
+        set_accessability(driver, wait)
+    elif step.name == "CZbozi.zdrojceny":
+        set_price_source_to_product(driver, wait)
+    elif step.label is not None:
+        inline_edit_brand_js(driver, wait, step.name, step.label)
+    else:
+        inline_edit_text(driver, wait, step.name, step.value)
+
+
+def prepare_field_plan(driver, steps):
+    """
+    Resolves every step against the product page in one script. Returns
+    (prepared, failed): (step, request) pairs and the steps that couldn't be resolved.
+    """
+    payload = [{
+        "kind": step.kind,
+        "name": step.name,
+        "label": step.label,
+        "input": PRICE_INPUT_ID,
+        "value": text_to_html(step.value) if step.kind == "description" else step.value,
+    } for step in steps]
+    results = driver.execute_async_script(PREPARE_FIELDS_JS, payload)
+
+    prepared, failed = [], []
+    for step, result in zip(steps, results):
+        if result.get("error"):
+            print(f"⚠️ {step.name}: {result['error']}")
+            failed.append(step)
+        else:
+            prepared.append((step, result["request"]))
+    return prepared, failed
+
+
+def apply_field_plan(driver, wait, product_url, prepared, failed, timer):
+    """
+    Posts all prepared saves at once from inside the page (no widget round-trips,
+    no reloads); steps that couldn't be prepared or saved are redone in the editors.
+    """
+    failed = list(failed)
+    if prepared:
+        with timer.step("fields"):
+            results = driver.execute_async_script(APPLY_FIELDS_JS, [req for _, req in prepared])
+        for (step, _), result in zip(prepared, results):
+            timer.add(step.name, result["ms"] / 1000)
+            if result["error"]:
+                print(f"⚠️ {step.name}: {result['error']}")
+                failed.append(step)
+
+    if failed:
+        driver.get(product_url)
+        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, '.sidebar')))
+    for step in failed:
+        with timer.step(f"{step.name} (UI)"):
+            apply_step_ui(driver, wait, step)
 
 
 def group_products_by_subcategory(products, brand_name=None):
     grouped = defaultdict(list)
     for prod in products:
-        url = prod.get("category_url", "")
-        if brand_name:
-            after_brand = url.split(f"/{brand_name}/", 1)[-1]
-            parts = after_brand.strip("/").split("/")
-            if len(parts) > 1:
-                subcategory = "/".join(parts[:-1])
-            else:
-                subcategory = "" 
-        else:
-            subcategory = url.split("/")[-2]
-        grouped[subcategory].append(prod)
+        grouped[subcategory_of(prod.get("category_url", ""), brand_name)].append(prod)
     return grouped
 
 
-
 def pretty_print_grouped_products(grouped_products):
     for category, products in grouped_products.items():
         print(f"{category}")
@@ -240,50 +611,144 @@ def pretty_print_grouped_products(grouped_products):
         print()
 
 
-def extract_external_id(url):
-    return url.rstrip('/').split('-')[-1]
-
 def create_product(driver, wait, prod, brand_name):
-    driver.get('https://www.motobuzz.lv/admin/kategorie-1929')
-    wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, '.sidebar')))
+    timer = StepTimer("selenium")
+    with timer.step("create"):
+        driver.get(CATEGORY_URL)
+        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, '.sidebar')))
 
-    add_btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, 'a.pridat.btn.btn-xs.btn-success')))
-    add_btn.click()
-    wait.until(EC.visibility_of_element_located((By.ID, 'nazev'))).send_keys(prod['name'])
-    driver.find_element(By.ID, 'cena').send_keys(prod['price'].replace(',', '.'))
-    driver.find_element(By.CSS_SELECTOR, '.modal-footer button[type=submit]').click()
-    wait.until(EC.url_contains('/admin/kategorie-1929/zbozi-'))
+        add_btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, 'a.pridat.btn.btn-xs.btn-success')))
+        add_btn.click()
+        wait.until(EC.visibility_of_element_located((By.ID, 'nazev'))).send_keys(prod['name'])
+        driver.find_element(By.ID, 'cena').send_keys(prod['price'].replace(',', '.'))
+        driver.find_element(By.CSS_SELECTOR, '.modal-footer button[type=submit]').click()
+        wait.until(EC.url_contains(f'/{CATEGORY_PATH}/zbozi-'))
 
     current_url = driver.current_url
     external_id = extract_external_id(current_url)
+    created = {
+        "product_url": current_url,
+        "product_pk": None,
+        "external_id": external_id,
+        "original_url": prod.get('product_url')
+    }
 
-    wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, 'a.inlineedit[data-name="CPolozka.code"]')))
-    code_elem = driver.find_element(By.CSS_SELECTOR, 'a.inlineedit[data-name="CPolozka.code"]')
-    internal_id = "P" + code_elem.get_attribute("data-pk")
+    try:
+        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, 'a.inlineedit[data-name="CPolozka.code"]')))
+        code_elem = driver.find_element(By.CSS_SELECTOR, 'a.inlineedit[data-name="CPolozka.code"]')
+        created["product_pk"] = "P" + code_elem.get_attribute("data-pk")
+
+        # Все поля читаются со страницы сразу после создания и сохраняются без перезагрузок;
+        # цена и наличие — после вариантов, как и раньше
+        with timer.step("prepare"):
+            prepared, failed = prepare_field_plan(driver, build_field_plan(prod, brand_name))
+        apply_field_plan(driver, wait, current_url,
+                         [p for p in prepared if not p[0].late], [s for s in failed if not s.late], timer)
+
+        with timer.step("images"):
+            upload_images(driver, wait, prod['images'])
+        with timer.step("variants"):
+            upload_variants(driver, wait, prod['sizes'])
+
+        apply_field_plan(driver, wait, current_url,
+                         [p for p in prepared if p[0].late], [s for s in failed if s.late], timer)
+        wait_for_requests(driver, "create")
+    except Exception as e:
+        raise AdminClientError(f"Ошибка заполнения товара {external_id}: {e}", created=created) from e
 
-    inline_edit_text(driver, wait, 'CPolozka.ean', prod['ean'])
-    inline_edit_text(driver, wait, 'CZbozi.dodavatelurl', 'https://jopa.nl/en/')
-    inline_edit_brand_js(driver, wait, 'CZbozi.vyrobce_id', brand_name)
+    print(f"✔ Готово: {prod['name']} (internal PK: {created['product_pk']}, external ID: {external_id}) URL: {current_url}")
+    print(f"⏱ {timer.summary()}")
+    return created
 
-    fill_tinymce(driver, wait, 'zbozi.popis', prod['short-description'])
-    fill_tinymce(driver, wait, 'zbozi.popis2', prod['long-description'])
 
-    upload_images(driver, wait, prod['images'])
-    upload_variants(driver, wait, prod['sizes'])
+def update_product(driver, wait, entry, prod, changed, brand_name):
+    """
+    Brings an already uploaded product (a sync ledger entry) up to date in the
+    changed fields only. Images and sizes are only added, never removed.
+    """
+    timer = StepTimer("selenium")
+    with timer.step("open"):
+        driver.get(entry["product_url"])
+        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, '.sidebar')))
 
-    set_price_source_to_product(driver, wait)
-    set_accessability(driver, wait)
+    prepared, failed = [], []
+    steps = build_update_plan(prod, changed, brand_name)
+    if steps:
+        with timer.step("prepare"):
+            prepared, failed = prepare_field_plan(driver, steps)
+        apply_field_plan(driver, wait, entry["product_url"],
+                         [p for p in prepared if not p[0].late], [s for s in failed if not s.late], timer)
+
+    new_images = added_items(entry, prod, "images") if "images" in changed else []
+    if new_images:
+        with timer.step("images"):
+            upload_images(driver, wait, new_images)
+    new_sizes = added_items(entry, prod, "sizes") if "sizes" in changed else []
+    if new_sizes:
+        with timer.step("variants"):
+            upload_variants(driver, wait, new_sizes)
+
+    late_prepared, late_failed = [p for p in prepared if p[0].late], [s for s in failed if s.late]
+    if late_prepared or late_failed:
+        apply_field_plan(driver, wait, entry["product_url"], late_prepared, late_failed, timer)
+
+    print(f"✔ Обновлено: {prod['name']} ({', '.join(changed)}) URL: {entry['product_url']}")
+    print(f"⏱ {timer.summary()}")
+
+
+def select_podobne(driver, wait, query, codes):
+    """
+    Filters the "podobné" table by `query`, ticks every listed product whose code
+    is in `codes` and confirms them with one click. Returns the codes ticked.
+    """
+    modal = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "div.widget-main.padding-8")))
+
+    radio_label = modal.find_element(
+        By.XPATH,
+        ".//span[contains(@class, 'lbl') and contains(text(), 'vybrat přes filtr')]"
+    )
+    driver.execute_script("arguments[0].scrollIntoView(true);", radio_label)
+    driver.execute_script("arguments[0].click();", radio_label)
+
+    wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, "form.filtr")))
+
+    search_input = modal.find_element(By.CSS_SELECTOR, "input#hledat")
+    search_input.clear()
+    search_input.send_keys(query)
+
+    old_rows = modal.find_elements(By.CSS_SELECTOR, "table.produkty tr")
+    filter_btn = modal.find_element(By.CSS_SELECTOR, "button.btn.btn-primary.filtrovat")
+    filter_btn.click()
+    if old_rows:
+        wait.until(EC.staleness_of(old_rows[0]))
+    wait_for_requests(driver, "podobne-filter")
+    wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, "table.produkty")))
+
+    selected = []
+    for row in modal.find_elements(By.CSS_SELECTOR, "table.produkty tr"):
+        code = row_code(row.text, codes)
+        checkboxes = row.find_elements(By.CSS_SELECTOR, "input[type='checkbox'].ace.zatrhnout")
+        if not code or not checkboxes or code in selected:
+            continue
+        label = checkboxes[0].find_element(By.XPATH, "./following-sibling::span[contains(@class, 'lbl')]")
+        driver.execute_script("arguments[0].scrollIntoView(true);", label)
+        driver.execute_script("arguments[0].click();", label)
+        selected.append(code)
+
+    if selected:
+        select_btn = modal.find_element(By.CSS_SELECTOR, "div.table-footer a.vyber.btn.btn-xs.btn-success")
+        select_btn.click()
+        wait_for_requests(driver, "podobne-save")
+    return selected
 
-    print(f"✔ Готово: {prod['name']} (internal PK: {internal_id}, external ID: {external_id}) URL: {current_url}")
-    return {
-        "product_url": current_url,
-        "product_pk": internal_id,
-        "external_id": external_id,
-        "original_url": prod.get('product_url')
-    }
 
 def add_podobne_products(driver, wait, base_external_id, podobne_internal_ids):
-    base_url = f"https://www.motobuzz.lv/admin/kategorie-1929/zbozi-{base_external_id}"
+    """
+    Links the product to the internal codes it isn't linked to yet. Links are read
+    once; the missing ones are ticked together from one filter query and only the
+    codes that query didn't list are searched one by one.
+    """
+    base_url = f"{CATEGORY_URL}/zbozi-{base_external_id}"
     driver.get(base_url)
     try:
         wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, '.sidebar')))
@@ -296,96 +761,293 @@ def add_podobne_products(driver, wait, base_external_id, podobne_internal_ids):
 
     wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, "div.widget-main")))
 
-    for pid in podobne_internal_ids:
-        if pid == base_external_id:
-            continue
-
-        modal = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "div.widget-main.padding-8")))
-
-        radio_label = modal.find_element(
-            By.XPATH,
-            ".//span[contains(@class, 'lbl') and contains(text(), 'vybrat přes filtr')]"
-        )
-        driver.execute_script("arguments[0].scrollIntoView(true);", radio_label)
-        driver.execute_script("arguments[0].click();", radio_label)
-
-        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, "form.filtr")))
-        
-        search_input = modal.find_element(By.CSS_SELECTOR, "input#hledat")
-        search_input.clear()
-        search_input.send_keys(pid)
-
-        filter_btn = modal.find_element(By.CSS_SELECTOR, "button.btn.btn-primary.filtrovat")
-        filter_btn.click()
-
-        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, "table.produkty")))
-
-        checkbox = modal.find_element(By.CSS_SELECTOR, "input[type='checkbox'].ace.zatrhnout")
-        label = checkbox.find_element(By.XPATH, "./following-sibling::span[contains(@class, 'lbl')]")
-        driver.execute_script("arguments[0].scrollIntoView(true);", label)
-        driver.execute_script("arguments[0].click();", label)
-
-        select_btn = modal.find_element(By.CSS_SELECTOR, "div.table-footer a.vyber.btn.btn-xs.btn-success")
-        select_btn.click()
-        print(f"✔ Добавлен podobny товар с id {pid} к товару {base_external_id}")
-
-
+    if not driver.find_elements(By.CSS_SELECTOR, PODOBNE_TABLE_SELECTOR):
+        print(f"⚠️ Таблица похожих товаров не найдена у {base_external_id}, связывание пропущено")
+        return
 
-    driver.refresh()
-    wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, '.sidebar')))
+    linked = {el.text.strip() for el in driver.find_elements(By.CSS_SELECTOR, PODOBNE_LINKED_SELECTOR)}
+    missing = [pid for pid in podobne_internal_ids if pid not in linked]
+    if not missing:
+        print(f"✔ Все похожие товары уже связаны с {base_external_id}")
+        return
 
+    pending = list(missing)
+    query = podobne_query(pending)
+    if query:
+        selected = select_podobne(driver, wait, query, pending)
+        pending = [pid for pid in pending if pid not in selected]
+    for pid in pending:
+        if not select_podobne(driver, wait, pid, [pid]):
+            print(f"⚠️ Товар {pid} не найден фильтром")
+    print(f"✔ Добавлено {len(missing)} podobne товаров к товару {base_external_id}")
+
+
+def podobne_graph(grouped, created_products):
+    """
+    external_id → internal codes of the other created products of its subcategory:
+    the full set of "podobné" links the upload should end up with.
+    """
+    by_url = {p["original_url"]: p for p in created_products if p.get("product_pk")}
+    graph = {}
+    for prods in grouped.values():
+        created = [by_url[prod['product_url']] for prod in prods if prod['product_url'] in by_url]
+        for p in created:
+            graph[p["external_id"]] = [o["product_pk"] for o in created if o["product_pk"] != p["product_pk"]]
+    return graph
+
+
+def link_podobne(external_id, codes, client, browser):
+    if client:
+        try:
+            missing = client.add_podobne(external_id, codes)
+            if missing is None:
+                return
+            print(f"✔ Добавлено {len(missing)} podobne товаров к товару {external_id} (HTTP)")
+            return
+        except (AdminClientError, requests.RequestException) as e:
+            print(f"✘ HTTP-связывание не удалось ({e}), пробуем через браузер")
+    driver, wait = browser.get()
+    add_podobne_products(driver, wait, external_id, codes)
+
+
+
+class LazyBrowser:
+    """
+    Chrome logged into the admin, started on first use. With the fast profile the
+    session saved by an earlier run is reused and a fresh login is saved.
+    """
+
+    def __init__(self, username, password, headless=False, profile=BROWSER_PROFILE):
+        self.username = username
+        self.password = password
+        self.headless = headless
+        self.fast = profile == "fast"
+        self.driver = None
+        self.wait = None
+
+    def get(self):
+        if not self.driver:
+            self.driver, self.wait = init_driver(self.headless, fast=self.fast)
+            if not (self.fast and restore_session(self.driver, self.wait, ADMIN_URL)):
+                login(self.driver, self.wait, ADMIN_URL, self.username, self.password)
+                if self.fast:
+                    save_session(self.driver)
+        return self.driver, self.wait
+
+    def quit(self):
+        if self.driver:
+            self.driver.quit()
+            self.driver = None
+
+
+def http_client(username, password):
+    client = AdminClient()
+    try:
+        client.login(username, password)
+        return client
+    except (AdminClientError, requests.RequestException) as e:
+        print(f"✘ HTTP-вход не удался ({e}), используем браузер")
+        return None
+
+
+def upload_product(prod, brand_name, client, browser):
+    """
+    Creates one product over HTTP when a client is given, otherwise (or if the
+    product wasn't created over HTTP) in the browser, and records it in the sync
+    ledger. A product created but not fully filled is recorded as such, so the
+    next run fills it in instead of creating it again. Returns the created mapping or None.
+    """
+    ledger = get_ledger()
+    try:
+        created = None
+        if client:
+            try:
+                created = client.create_product(prod, brand_name)
+            except (AdminClientError, requests.RequestException) as e:
+                created = getattr(e, "created", None)
+                if created:
+                    ledger.record(created, prod, brand_name, complete=False)
+                    print(f"✘ {e} — товар создан частично, будет дозаполнен при следующем запуске")
+                    return created
+                print(f"✘ HTTP-загрузка не удалась ({e}), пробуем через браузер")
+        if created is None:
+            driver, wait = browser.get()
+            created = create_product(driver, wait, prod, brand_name)
+        ledger.record(created, prod, brand_name)
+        return created
+    except Exception as e:
+        traceback.print_exc()
+        created = getattr(e, "created", None)
+        if created:
+            ledger.record(created, prod, brand_name, complete=False)
+            print(f"✘ {prod['name']} создан частично, будет дозаполнен при следующем запуске")
+            return created
+        print(f"✘ Ошибка при создании {prod['name']}")
+        return None
+
+
+def sync_product(prod, changed, entry, brand_name, client, browser):
+    """
+    Updates the changed fields of an uploaded product (over HTTP when a client is
+    given, else in the browser) and records the new state in the sync ledger.
+    """
+    try:
+        done = False
+        if client:
+            try:
+                client.update_product(entry, prod, changed, brand_name)
+                done = True
+            except (AdminClientError, requests.RequestException) as e:
+                print(f"✘ HTTP-обновление не удалось ({e}), пробуем через браузер")
+        if not done:
+            driver, wait = browser.get()
+            update_product(driver, wait, entry, prod, changed, brand_name)
+        get_ledger().record(entry, prod, brand_name)
+        return True
+    except Exception:
+        traceback.print_exc()
+        print(f"✘ Ошибка при обновлении {prod['name']}")
+        return False
+
+
+def prefetch_images(prod):
+    """
+    Starts downloading the images uploading `prod` will need: all of them for a
+    new product, the added ones for a product whose images changed.
+    """
+    action, changed, entry = get_ledger().diff(prod)
+    if action == "create":
+        get_pipeline().prefetch(prod.get('images', []))
+    elif "images" in changed:
+        get_pipeline().prefetch(added_items(entry, prod, "images"))
+
+
+def upload_stream(products, brand_name, username, password, backend="selenium", workers=1, fields=None):
+    """
+    Uploads products from any iterable (a list, or a generator fed by earlier
+    pipeline stages) as they arrive, then links related products. Each product is
+    created, updated or skipped according to the sync ledger. With workers > 1
+    products are handled by that many headless browsers (and HTTP clients with
+    backend="http") pulling from the same iterable.
+    With `fields` (e.g. ("price", "sizes")) only already uploaded products are
+    updated, and only when nothing but those fields changed; new products and
+    other changes are left for a full upload.
+    Returns counts of created, updated and skipped products, of products whose
+    creation or update failed, and of products left out for having no description
+    or (with `fields`) for needing a full upload.
+    """
+    ledger = get_ledger()
+    source, source_lock = iter(products), threading.Lock()
+    lock, url_locks = threading.Lock(), defaultdict(threading.Lock)
+    seen, mappings, new_urls = {}, {}, set()
+    counts = {"create": 0, "update": 0, "skip": 0, "failed": 0, "no_description": 0, "full_upload": 0}
+
+    def handle(prod, client, browser):
+        url = prod['product_url']
+        if not (prod.get('short-description') and prod.get('long-description')):
+            # Пустое описание не загружаем ни в новый товар, ни поверх существующего
+            print(f"✘ Нет описания, пропускаем: {prod['name']}")
+            with lock:
+                counts["no_description"] += 1
+            return
+        with lock:
+            url_lock = url_locks[url]
+        # Повторная запись того же товара (с объединёнными размерами) ждёт, пока первая не попадёт в журнал
+        with url_lock:
+            action, changed, entry = ledger.diff(prod)
+            if fields is not None and (action == "create" or set(changed) - set(fields)):
+                print(f"↷ Нужна полная загрузка, пропускаем: {prod['name']}")
+                with lock:
+                    counts["full_upload"] += 1
+                return
+            mapping, ok = entry, True
+            with metrics.timer("upload_product_seconds", action=action):
+                if action == "create":
+                    mapping = upload_product(prod, brand_name, client, browser)
+                    ok = mapping is not None
+                elif action == "update":
+                    ok = sync_product(prod, changed, entry, brand_name, client, browser)
+                elif entry["content_hash"] != content_hash(prod):
+                    # Поменялось только то, что на сайт не загружается
+                    ledger.record(entry, prod, brand_name)
+        if ok:
+            metrics.inc("uploads_total", action=action)
+        else:
+            metrics.inc("upload_failures_total", action=action)
+        with lock:
+            counts[action if ok else "failed"] += 1
+            seen[url] = prod
+            if mapping:
+                mappings[url] = mapping
+                if action == "create":
+                    new_urls.add(url)
+
+    def worker():
+        browser = LazyBrowser(username, password, headless=workers > 1)
+        client = http_client(username, password) if backend == "http" else None
+        try:
+            while True:
+                with source_lock:
+                    prod = next(source, None)
+                if prod is None:
+                    return
+                handle(prod, client, browser)
+        finally:
+            browser.quit()
+
+    threads = [threading.Thread(target=worker, name=f"upload-{n}") for n in range(max(1, workers))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"Создано {counts['create']}, обновлено {counts['update']}, без изменений {counts['skip']} товаров"
+          + (f", с ошибкой {counts['failed']}" if counts["failed"] else "")
+          + (f", без описания {counts['no_description']}" if counts["no_description"] else "")
+          + (f", ждут полной загрузки {counts['full_upload']}" if counts["full_upload"] else ""))
+
+    # Связываем товары подкатегорий, где появились новые: читаем уже существующие связи и добавляем только недостающие
+    grouped = group_products_by_subcategory(list(seen.values()), brand_name)
+    grouped_new = {subcat: prods for subcat, prods in grouped.items()
+                   if any(prod['product_url'] in new_urls for prod in prods)}
+    graph = {ext: codes for ext, codes in podobne_graph(grouped_new, list(mappings.values())).items() if codes}
+    if graph:
+        browser = LazyBrowser(username, password)
+        client = http_client(username, password) if backend == "http" else None
+        try:
+            for external_id, codes in graph.items():
+                print(f"Добавляем похожие для товара с external_id={external_id}: {codes}")
+                link_podobne(external_id, codes, client, browser)
+        finally:
+            browser.quit()
+    return counts
 
 
-def start_upload(file_path, brand_name):
+def admin_credentials():
     load_dotenv()  
     username = os.getenv("MOTOBUZZ_USERNAME")
     password = os.getenv("MOTOBUZZ_PASSWORD")
     if not username or not password:
         raise RuntimeError("Не найдены MOTOBUZZ_USERNAME или MOTOBUZZ_PASSWORD в .env")
+    return username, password
 
-    products = load_products(file_path)
 
-    grouped = group_products_by_subcategory(products, brand_name)
-    pretty_print_grouped_products(grouped) 
+def start_upload(file_path, brand_name, backend="selenium", workers=1):
+    """
+    Uploads every product of a saved products file (or, with file_path=None, the
+    brand's products in the catalog) and links related ones (see upload_stream). backend="http" creates products through AdminClient and
+    falls back to the browser for a product only if it wasn't created over HTTP;
+    the browser is started only when it is needed.
+    """
+    username, password = admin_credentials()
 
-    driver, wait = init_driver()
-    login(driver, wait, 'https://www.motobuzz.lv/admin/', username, password)
+    products = load_products(file_path) if file_path else get_catalog().products(brand_name, merged=True)
 
-    created_products = [] 
+    grouped = group_products_by_subcategory(products, brand_name)
+    pretty_print_grouped_products(grouped) 
 
+    # Картинки качаются в фоне, пока браузер логинится и создаёт первые товары
     for prod in products:
-        try:
-            created = create_product(driver, wait, prod, brand_name)
-            created_products.append(created)
-            time.sleep(2)
-        except Exception:
-            traceback.print_exc()
-            print(f"✘ Ошибка при создании {prod['name']}")
-
-    # Создаём словари для поиска
-    url_to_internal_pk = {p["original_url"]: p["product_pk"] for p in created_products}
-    url_to_external_id = {p["original_url"]: p["external_id"] for p in created_products}
-
-    print(f"Создано {len(created_products)} товаров")
-    print(f"Создано {len(url_to_internal_pk)} товаров с внутренними ID")
-
-    # Добавляем podobne для товаров из каждой подкатегории
-    for subcat, prods in grouped.items():
-        internal_pks = [url_to_internal_pk.get(prod['product_url']) for prod in prods if prod['product_url'] in url_to_internal_pk]
-
-        for prod in prods:
-            base_external_id = url_to_external_id.get(prod['product_url'])
-            base_internal_id = url_to_internal_pk.get(prod['product_url'])
-
-            if not base_external_id or not base_internal_id:
-                continue
-
-            podobne_internal_pks = [pk for pk in internal_pks if pk != base_internal_id]
-            print(f"DEBUG: podobne_internal_pks: {podobne_internal_pks}")
-
-            print(f"Добавляем похожие для товара с external_id={base_external_id} и internal_id={base_internal_id}")
-            add_podobne_products(driver, wait, base_external_id, podobne_internal_pks)
-
+        prefetch_images(prod)
 
-    driver.quit()
-    print("✔ Все товары загружены и связаны как подобные")
\ No newline at end of file
+    upload_stream(products, brand_name, username, password, backend, workers)
+    print("✔ Все товары загружены и связаны как подобные")